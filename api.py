@@ -0,0 +1,196 @@
+"""
+HTTP extraction service for systems that cannot use the Streamlit UI.
+
+    uvicorn api:api --host 0.0.0.0 --port 8000
+
+    POST /documents            multipart upload (field "file"); returns 202 and a job ID
+    GET  /jobs/{job_id}        status, per-page progress and the fields received so far
+    GET  /jobs/{job_id}/result autofilled form fields, combined JSON and the extraction report
+    GET  /submissions          stored submissions by nic_new, mid, tid, account and/or date range
+
+Uploads are queued on the same job store the Streamlit apps use (see jobs.py), so
+requests only read the upload and return; API_WORKERS worker threads extract documents
+with bounded concurrency no matter how many requests are waiting. Request bodies larger
+than an upload may be are refused with 413 by UploadSizeLimit before they are parsed.
+"""
+import os
+import sys
+import importlib
+from datetime import datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from pymongo.errors import PyMongoError
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from jobs import get_job_store, JobWorkerPool, DONE, FAILED
+from submissions import find_submissions, create_indexes_at_startup
+
+# Load environment variables from .env file
+load_dotenv()
+
+# App module whose extraction model, prompt and form schema the service uses (main, main5, main6, main7)
+API_APP = os.getenv("API_APP", "main7")
+# Documents extracted at the same time by this process; 0 leaves jobs to `python jobs.py` workers
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+# Uploads larger than this are rejected with 413
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+# Room in a request body for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".jpg", ".jpeg", ".png")
+IMAGE_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+app = importlib.import_module(API_APP)
+
+@asynccontextmanager
+async def lifespan(_):
+    error = await run_in_threadpool(create_indexes_at_startup)
+    if error:
+        print(f"Submission indexes not created yet ({error}); lookups may scan until the first write.", file=sys.stderr)
+    pool = JobWorkerPool(get_job_store(), app.JOB_QUEUE, app.process_job, API_WORKERS).start()
+    yield
+    await run_in_threadpool(pool.stop)
+
+def _too_large_response():
+    return JSONResponse({"detail": f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."}, status_code=413)
+
+class UploadSizeLimit:
+    """
+    ASGI middleware that refuses request bodies too large to hold a MAX_UPLOAD_BYTES
+    upload before the multipart parser spools them: at once from Content-Length, or,
+    for chunked bodies, as soon as the bytes received pass the limit.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await _too_large_response()(scope, receive, send)
+            return
+        received = 0
+        refused = False
+        async def limited_receive():
+            nonlocal received, refused
+            if refused:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # The app sees a disconnect and stops parsing; the client gets the 413
+                    refused = True
+                    await _too_large_response()(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+        async def guarded_send(message):
+            if not refused:
+                await send(message)
+        await self.app(scope, limited_receive, guarded_send)
+
+api = FastAPI(title="FormExtract AI", lifespan=lifespan)
+api.add_middleware(UploadSizeLimit)
+
+# Read the upload Starlette has spooled; UploadSizeLimit already bounded the request body,
+# this enforces the exact limit on the file itself
+async def read_upload(file):
+    file_bytes = await file.read()
+    if len(file_bytes) > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    return file_bytes
+
+async def get_job_or_404(job_id):
+    job = await run_in_threadpool(get_job_store().get, job_id)
+    if job is None or job["queue"] != app.JOB_QUEUE:
+        raise HTTPException(404, "Unknown job.")
+    return job
+
+@api.get("/health")
+async def health():
+    return {"status": "ok", "app": API_APP, "workers": API_WORKERS}
+
+@api.post("/documents", status_code=202)
+async def upload_document(file: UploadFile = File(...)):
+    """
+    Queue an image, PDF or DOCX for extraction. An identical earlier upload returns
+    its existing job instead of being extracted again.
+    """
+    file_name = os.path.basename(file.filename or "").lower()
+    extension = os.path.splitext(file_name)[1]
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(415, f"Unsupported file type; upload one of {', '.join(SUPPORTED_EXTENSIONS)}.")
+    file_bytes = await read_upload(file)
+    if not file_bytes:
+        raise HTTPException(400, "The uploaded file is empty.")
+    # The extraction pipeline tells images apart by MIME type and documents by extension
+    file_type = IMAGE_TYPES.get(extension, file.content_type or "application/octet-stream")
+    job_id = await run_in_threadpool(app.submit_job, file_name, file_type, file_bytes)
+    job = await get_job_or_404(job_id)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }
+
+@api.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await get_job_or_404(job_id)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "file_name": job["file_name"],
+        "done_pages": job["done_pages"],
+        "total_pages": job["total_pages"],
+        "fields": job["fields"],
+        "error": job["error"],
+    }
+
+@api.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """
+    Return the autofilled form fields of a finished job. Jobs still queued or running
+    answer 409, failed jobs 422 with the reason.
+    """
+    job = await get_job_or_404(job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(422, job["error"])
+    if job["status"] != DONE:
+        raise HTTPException(409, f"Job is {job['status']}; poll /jobs/{job_id} until it is done.")
+    result = job["result"]
+    return {
+        "job_id": job["id"],
+        "fields": result["autofill"],
+        "extracted": result["combined_json"],
+        "failed_pages": result["failed_pages"],
+        "report": result["report"],
+    }
+
+@api.get("/submissions")
+async def lookup_submissions(
+    nic_new: str = None,
+    mid: str = None,
+    tid: str = None,
+    account: str = None,
+    submitted_from: datetime = None,
+    submitted_to: datetime = None,
+    limit: int = 50,
+):
+    """
+    Search stored submissions by identifier and/or submission date, newest first.
+    Every query is served by one of the indexes created by submissions.ensure_indexes.
+    """
+    try:
+        documents = await run_in_threadpool(
+            find_submissions, nic_new, mid, tid, account, submitted_from, submitted_to, limit
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except PyMongoError as e:
+        raise HTTPException(503, f"Database unavailable: {e}")
+    return {"count": len(documents), "submissions": documents}
@@ -0,0 +1,176 @@
+"""
+Headless batch extraction for folders or ZIP archives of scanned applications.
+
+    python batch.py applications/ --output results.jsonl
+    python batch.py applications.zip --output results.csv --format csv --workers 4
+
+Each document is written as one JSONL/CSV row as soon as it finishes, so the run can be
+interrupted and restarted: documents that already have an "ok" row in the output are skipped.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import zipfile
+import argparse
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import http_client
+from pipeline import MAX_CONCURRENT_EXTRACTIONS
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".jpg", ".jpeg", ".png")
+# The app's load_document tells images apart by MIME type and documents by extension
+IMAGE_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+BASE_COLUMNS = ["document", "status", "error", "pages", "duplicate_pages", "skipped_pages", "refined_fields", "decode_seconds", "extract_seconds", "total_seconds"]
+
+# Yield (document id, loader) for every supported file in a directory or ZIP archive
+def iter_documents(source):
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            names = sorted(n for n in archive.namelist() if not n.endswith("/") and not n.startswith("__MACOSX/"))
+        for name in names:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield f"{os.path.basename(source)}:{name}", lambda name=name: _read_zip_member(source, name)
+        return
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, fname)
+                yield os.path.relpath(path, source), lambda path=path: _read_file(path)
+
+def _read_zip_member(source, name):
+    with zipfile.ZipFile(source) as archive:
+        return archive.read(name)
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def process_document(app, document, loader):
+    """
+    Run one document through the app's own load_document and extract_document (text layer,
+    deduplication, page classification, extraction, merge, region refinement) and autofill.
+    Returns an output row; failures are reported in the row instead of raised.
+    """
+    row = {"document": document, "status": "ok", "error": None, "pages": 0}
+    started = time.perf_counter()
+    try:
+        file_name = document.lower()
+        file_type = IMAGE_TYPES.get(os.path.splitext(file_name)[1], "application/octet-stream")
+        images, text_fields, skipped_text_pages = app.load_document(file_name, file_type, loader())
+        if images is None:
+            raise ValueError("Unsupported file type.")
+        if not images and not text_fields:
+            if skipped_text_pages:
+                raise ValueError(f"No pages look like a {app.FORM_SCHEMA.title}.")
+            raise ValueError("No images found in the document.")
+        decoded = time.perf_counter()
+        row["pages"] = len(images)
+        row["decode_seconds"] = round(decoded - started, 3)
+        combined_json, page_results, report, _ = app.extract_document(images, text_fields)
+        row["duplicate_pages"] = report["duplicate_pages"]
+        row["skipped_pages"] = skipped_text_pages + report["skipped_pages"]
+        row["refined_fields"] = len(report["refined_fields"])
+        row["extract_seconds"] = round(time.perf_counter() - decoded, 3)
+        row["fields"] = app.match_and_autofill_fields(combined_json)
+        # Pages that failed after retries keep an {"error": ...} entry; such a document is not
+        # done, so it is written as an error and retried when the run is resumed
+        row["failed_pages"] = sum(1 for page in page_results if "error" in page)
+        if row["failed_pages"]:
+            row["status"] = "error"
+            row["error"] = f"{row['failed_pages']} page(s) could not be extracted"
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = str(e)
+    row["total_seconds"] = round(time.perf_counter() - started, 3)
+    return row
+
+# A crash can leave a half-written last line; treat it as not done
+def _parse_jsonl_line(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return {}
+
+# Documents that already finished successfully in a previous run of the same output file
+def load_completed(output_path, output_format):
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, newline="", encoding="utf-8") as f:
+        if output_format == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (_parse_jsonl_line(line) for line in f if line.strip())
+        for row in rows:
+            if row.get("status") == "ok":
+                completed.add(row["document"])
+    return completed
+
+class RowWriter:
+    """
+    Append rows to the JSONL or CSV output, flushing after each one so a crash
+    never loses finished documents.
+    """
+    def __init__(self, output_path, output_format, field_names):
+        self.output_format = output_format
+        self.field_names = field_names
+        self.lock = threading.Lock()
+        write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, "a", newline="", encoding="utf-8")
+        if output_format == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=BASE_COLUMNS + field_names, extrasaction="ignore")
+            if write_header:
+                self.writer.writeheader()
+
+    def write(self, row):
+        with self.lock:
+            if self.output_format == "csv":
+                flat = {k: row.get(k) for k in BASE_COLUMNS}
+                flat.update(row.get("fields") or {})
+                self.writer.writerow(flat)
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract merchant form data from a folder or ZIP of documents.")
+    parser.add_argument("source", help="Directory or .zip archive containing PDF, DOCX or image files")
+    parser.add_argument("--output", required=True, help="Output file (appended to, and used to resume)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Output format (default: from extension)")
+    parser.add_argument("--workers", type=int, default=2, help="Documents processed at the same time")
+    parser.add_argument("--app", default="main7", help="App module whose extraction model/prompt to use (main, main5, main6, main7)")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    app = importlib.import_module(args.app)
+    # Every worker runs a whole document's requests at once; keep a connection for each of them
+    if "HTTP_POOL_SIZE" not in os.environ:
+        http_client.HTTP_POOL_SIZE = max(http_client.HTTP_POOL_SIZE, args.workers * MAX_CONCURRENT_EXTRACTIONS)
+    completed = load_completed(args.output, output_format)
+    documents = [(doc, loader) for doc, loader in iter_documents(args.source) if doc not in completed]
+    print(f"{len(completed)} document(s) already done, {len(documents)} to process.", file=sys.stderr)
+
+    writer = RowWriter(args.output, output_format, list(app.REQUIRED_KEYS))
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {executor.submit(process_document, app, doc, loader): doc for doc, loader in documents}
+            for done, future in enumerate(as_completed(futures), start=1):
+                row = future.result()
+                writer.write(row)
+                if row["status"] != "ok":
+                    failures += 1
+                print(f"[{done}/{len(documents)}] {row['document']}: {row['status']} ({row['total_seconds']}s)", file=sys.stderr)
+    finally:
+        writer.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
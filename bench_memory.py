@@ -0,0 +1,83 @@
+"""
+Peak memory of building vision request bodies, before and after streaming the JSON body.
+
+    python bench_memory.py
+    python bench_memory.py --pages 20 --page-mb 4 > bench_output.txt
+
+"copy" is the previous path: base64 str of the page, an f-string data URL and the
+json= serialization done by requests. "stream" is the current path: the body is an
+http_client.StreamingJSONBody over extractors.ImageDataURL, read the way requests
+sends it. Each mode runs in a fresh process so its peak RSS is not shared.
+"""
+import os
+import sys
+import json
+import base64
+import argparse
+import resource
+import subprocess
+
+PROMPT = "Extract ALL visible information from this form image and return it as a valid JSON object."
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def build_copy_body(image_bytes):
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+    data = {
+        "model": "bench",
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+        ]}],
+        "temperature": 0,
+    }
+    return json.dumps(data).encode("utf-8")
+
+def build_stream_body(image_bytes):
+    from extractors import build_messages
+    from http_client import StreamingJSONBody
+    return StreamingJSONBody({"model": "bench", "messages": build_messages(image_bytes, PROMPT, "image/jpeg"), "temperature": 0})
+
+# Consume a body the way the HTTP client does and return the number of bytes "sent"
+def send(body):
+    if isinstance(body, bytes):
+        return len(body)
+    return sum(len(chunk) for chunk in body)
+
+def run_mode(mode, pages, page_bytes):
+    images = [os.urandom(page_bytes) for _ in range(pages)]
+    build = build_copy_body if mode == "copy" else build_stream_body
+    # Import everything up front so module loading is part of the baseline
+    send(build(b"warm up"))
+    baseline = peak_rss_bytes()
+    sent = 0
+    for image_bytes in images:
+        sent += send(build(image_bytes))
+    peak = peak_rss_bytes() - baseline
+    print(json.dumps({"mode": mode, "pages": pages, "page_bytes": page_bytes, "sent_bytes": sent, "peak_rss_over_baseline": peak}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--page-mb", type=float, default=3.0, help="size of each page image in MB")
+    parser.add_argument("--mode", choices=["copy", "stream"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    page_bytes = int(args.page_mb * 1024 * 1024)
+    if args.mode:
+        run_mode(args.mode, args.pages, page_bytes)
+        return
+    print(f"{args.pages} page(s) of {page_bytes / 1024 / 1024:.1f} MB")
+    for mode in ("copy", "stream"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--pages", str(args.pages), "--page-mb", str(args.page_mb)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        peak_mb = result["peak_rss_over_baseline"] / 1024 / 1024
+        print(f"{mode:>6}: peak RSS +{peak_mb:.1f} MB ({peak_mb * 1024 * 1024 / page_bytes:.2f}x page size), {result['sent_bytes']} bytes sent")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import io
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+import fitz  # PyMuPDF for PDF
+from PIL import Image, ImageSequence
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "render" sends exactly one rendered image per PDF page; "embedded" sends the image XObjects
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "render").lower()
+# Resolution used when rendering PDF pages
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+# Embedded images smaller than this on both sides (logos, stamps, signatures) are dropped
+MIN_EMBEDDED_IMAGE_SIDE = int(os.getenv("MIN_EMBEDDED_IMAGE_SIDE", "300"))
+
+# DOCX media the vision model accepts as-is; everything else is converted to PNG
+WEB_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+# Render every PDF page (or only the given page numbers) to a single PNG image, one page at a time
+def render_pdf_pages(pdf_bytes, dpi=None, pages=None):
+    dpi = dpi or PDF_RENDER_DPI
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            if pages is not None and page.number not in pages:
+                continue
+            pixmap = page.get_pixmap(dpi=dpi)
+            yield pixmap.tobytes("png")
+
+# Yield (page number, xref) of the embedded images worth sending, skipping repeated xrefs and tiny images
+def _embedded_image_xrefs(doc, min_side, pages):
+    seen_xrefs = set()
+    for page in doc:
+        if pages is not None and page.number not in pages:
+            continue
+        for img in page.get_images(full=True):
+            xref, width, height = img[0], img[2], img[3]
+            if xref in seen_xrefs:
+                continue
+            seen_xrefs.add(xref)
+            if width < min_side and height < min_side:
+                continue
+            yield page.number, xref
+
+# Extract the embedded images of a PDF one at a time
+def extract_embedded_pdf_images(pdf_bytes, min_side=None, pages=None):
+    min_side = MIN_EMBEDDED_IMAGE_SIDE if min_side is None else min_side
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for _, xref in _embedded_image_xrefs(doc, min_side, pages):
+            yield doc.extract_image(xref)["image"]
+
+class PdfImages:
+    """
+    The page images of a PDF, decoded lazily: every iteration renders (or extracts)
+    one image at a time, so a large scanned bundle is never held in memory as a whole.
+    len() is the number of images an iteration yields; it is counted without decoding.
+    page_numbers holds the 1-based PDF page each of those images comes from.
+    """
+    def __init__(self, pdf_bytes, mode=None, dpi=None, pages=None):
+        self.pdf_bytes = pdf_bytes
+        self.mode = (mode or PDF_EXTRACTION_MODE).lower()
+        self.dpi = dpi
+        self.pages = pages
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            if self.mode == "embedded":
+                numbers = [number for number, _ in _embedded_image_xrefs(doc, MIN_EMBEDDED_IMAGE_SIDE, pages)]
+            else:
+                numbers = [number for number in range(doc.page_count) if pages is None or number in pages]
+        self.page_numbers = [number + 1 for number in numbers]
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def __iter__(self):
+        if self.mode == "embedded":
+            return extract_embedded_pdf_images(self.pdf_bytes, pages=self.pages)
+        return render_pdf_pages(self.pdf_bytes, self.dpi, self.pages)
+
+# Extract images from PDF
+def extract_images_from_pdf(pdf_bytes, mode=None, dpi=None, pages=None):
+    """
+    Return the page images of a PDF to send for extraction, as a lazy PdfImages sequence.
+    In "render" mode (the default) every page is rendered once at the configured DPI,
+    so vector/text-only pages are included and logos or stamps never cost a separate call.
+    In "embedded" mode the embedded image XObjects are returned, filtered by size and xref.
+    pages optionally restricts the result to the given zero-based page numbers.
+    """
+    return PdfImages(pdf_bytes, mode, dpi, pages)
+
+# Map the image relationship IDs of word/document.xml to their part names (e.g. "word/media/image1.png")
+def _docx_image_targets(archive):
+    targets = {}
+    rels = ET.fromstring(archive.read("word/_rels/document.xml.rels"))
+    for rel in rels.iter(f"{_PACKAGE_REL_NS}Relationship"):
+        if rel.get("Type") == _IMAGE_REL_TYPE and rel.get("TargetMode") != "External":
+            target = rel.get("Target")
+            # Targets are relative to word/, or absolute from the package root
+            targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("word", target))
+    return targets
+
+# Part names of the images of word/document.xml in the order they appear in the document
+def _docx_media_in_order(archive):
+    targets = _docx_image_targets(archive)
+    ordered = []
+    for element in ET.fromstring(archive.read("word/document.xml")).iter():
+        # DrawingML pictures use r:embed, legacy VML pictures use r:id
+        rel_id = element.get(f"{_REL_NS}embed") or element.get(f"{_REL_NS}id")
+        target = targets.get(rel_id)
+        if target and target not in ordered:
+            ordered.append(target)
+    return ordered
+
+# Return a media part as images the model can read: web formats unchanged,
+# TIFF (every frame), GIF, BMP and EMF/WMF (where Pillow can rasterize them) as PNG
+def _media_to_images(name, data):
+    if name.lower().endswith(WEB_IMAGE_EXTENSIONS):
+        return [data]
+    images = []
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            frames = ImageSequence.Iterator(img) if name.lower().endswith((".tif", ".tiff")) else [img]
+            for frame in frames:
+                buffer = io.BytesIO()
+                frame.convert("RGB").save(buffer, format="PNG")
+                images.append(buffer.getvalue())
+    except Exception:
+        # Vector metafiles cannot be rasterized outside Windows; they are skipped
+        return []
+    return images
+
+# Extract images from DOCX
+def extract_images_from_docx(docx_bytes):
+    """
+    Return the images of a DOCX file, read straight from its bytes as a ZIP archive.
+    Images are returned in document order (following the relationship IDs of
+    word/document.xml); if the body references none, every file under word/media is used.
+    """
+    images = []
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as archive:
+        names = set(archive.namelist())
+        try:
+            media = [name for name in _docx_media_in_order(archive) if name in names]
+        except (KeyError, ET.ParseError):
+            media = []
+        if not media:
+            media = sorted(name for name in names if name.startswith("word/media/"))
+        for name in media:
+            images.extend(_media_to_images(name, archive.read(name)))
+    return images
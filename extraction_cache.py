@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", ".extraction_cache.sqlite3")
+# Entries older than this are treated as misses and purged
+EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Least recently used entries are evicted above this count
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+
+_connection = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+# Open (once) the SQLite cache database shared by all threads of the process
+def _get_connection():
+    global _connection
+    if _connection is None:
+        connection = sqlite3.connect(EXTRACTION_CACHE_PATH, check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_extractions_accessed ON extractions (accessed_at)")
+        connection.commit()
+        _connection = connection
+    return _connection
+
+def make_cache_key(image_bytes, prompt, model):
+    """
+    Content-address an extraction by the normalized image bytes, the prompt text
+    (so any prompt edit acts as a new prompt version) and the model name.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    digest.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    digest.update(model.encode("utf-8"))
+    return digest.hexdigest()
+
+# A result is worth caching only if it is a JSON object without an error key
+def is_cacheable_result(result):
+    try:
+        parsed = json.loads(result)
+    except (TypeError, json.JSONDecodeError):
+        return False
+    return isinstance(parsed, dict) and "error" not in parsed
+
+def get_cached_extraction(key):
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute(
+            "SELECT result, created_at FROM extractions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > EXTRACTION_CACHE_TTL_SECONDS:
+            if row is not None:
+                connection.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                connection.commit()
+            _stats["misses"] += 1
+            return None
+        connection.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+        connection.commit()
+        _stats["hits"] += 1
+        return row[0]
+
+def store_extraction(key, result):
+    if not EXTRACTION_CACHE_ENABLED or not is_cacheable_result(result):
+        return
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO extractions (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, result, now, now),
+        )
+        connection.execute("DELETE FROM extractions WHERE created_at < ?", (now - EXTRACTION_CACHE_TTL_SECONDS,))
+        connection.execute(
+            "DELETE FROM extractions WHERE key IN ("
+            "SELECT key FROM extractions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (EXTRACTION_CACHE_MAX_ENTRIES,),
+        )
+        connection.commit()
+
+def get_or_extract(image_bytes, prompt, model, extract_fn):
+    """
+    Return the cached extraction for this image/prompt/model if there is one,
+    otherwise call extract_fn() and cache its result when it parsed as valid JSON.
+    """
+    key = make_cache_key(image_bytes, prompt, model)
+    cached = get_cached_extraction(key)
+    if cached is not None:
+        return cached
+    result = extract_fn()
+    store_extraction(key, result)
+    return result
+
+def get_cache_stats():
+    """
+    Return hit/miss counts for this process and the number of stored entries.
+    """
+    with _lock:
+        stats = dict(_stats)
+        if EXTRACTION_CACHE_ENABLED:
+            stats["entries"] = _get_connection().execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        else:
+            stats["entries"] = 0
+    return stats
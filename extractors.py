@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import base64
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from pipeline import ERROR_RESULT
+from scheduler import get_scheduler
+from incremental_json import IncrementalJSONParser
+
+# Load environment variables from .env file
+load_dotenv()
+
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+GROQ_MODEL = os.getenv("GROQ_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "meta-llama/llama-4-scout")
+# Hedge after this many seconds until enough latencies are recorded to use their p95
+HEDGE_DEFAULT_SECONDS = float(os.getenv("HEDGE_DEFAULT_SECONDS", "8"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Stream completions and parse fields as they arrive instead of waiting for the full reply
+STREAM_EXTRACTION = os.getenv("STREAM_EXTRACTION", "true").lower() in ("1", "true", "yes")
+
+# Images are base64 encoded in slices of this many bytes (a multiple of 3, so the slices join cleanly)
+BASE64_CHUNK_BYTES = 3 * 256 * 1024
+
+# Appended to the prompt when several pages are sent in one request
+BATCH_PROMPT_SUFFIX = """
+<batch>
+The {count} images above are consecutive pages of ONE document.
+Return a SINGLE JSON object that merges the fields from all pages.
+</batch>
+"""
+
+# Model requests made inside record_model_calls(), shared with the threads a HedgedExtractor hands work to
+_recorded_calls = contextvars.ContextVar("recorded_calls", default=None)
+
+@contextmanager
+def record_model_calls():
+    """
+    Collect provenance of the model requests made by this thread (and hedged requests
+    it starts) inside the block: a list of {"model", "latency_seconds", "usage"} dicts.
+    usage has prompt/completion/total token counts when the provider reports them.
+    """
+    calls = []
+    token = _recorded_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _recorded_calls.reset(token)
+
+# Token counts from an SDK usage object or a usage dict of a JSON reply
+def _token_usage(usage):
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = {key: getattr(usage, key, None) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+    return {key: usage.get(key) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+def _record_call(model, started, usage=None):
+    calls = _recorded_calls.get()
+    if calls is not None:
+        calls.append({"model": model, "latency_seconds": round(time.monotonic() - started, 3), "usage": _token_usage(usage)})
+
+# Keep only the outermost {...} of a model reply and check that it parses
+def clean_json_response(content):
+    content = (content or "").strip()
+    if '{' in content:
+        content = content[content.find('{'):]
+    if '}' in content:
+        content = content[:content.rfind('}') + 1]
+    json.loads(content)
+    return content
+
+# A result counts as valid when it is a JSON object without an error key
+def is_valid_result(result):
+    try:
+        parsed = json.loads(result)
+    except (TypeError, json.JSONDecodeError):
+        return False
+    return isinstance(parsed, dict) and "error" not in parsed
+
+class ImageDataURL:
+    """
+    The data: URL of raw image bytes, base64 encoded only while it is written out and
+    one slice at a time, so building a request never holds a full base64 copy of the
+    image. len() is the length of the encoded URL; str() builds the whole URL for
+    SDKs that need a plain string.
+    """
+    def __init__(self, image_bytes, mime_type):
+        self.image_bytes = image_bytes
+        self.prefix = f"data:{mime_type};base64,".encode("ascii")
+
+    def __len__(self):
+        return len(self.prefix) + 4 * ((len(self.image_bytes) + 2) // 3)
+
+    def iter_chunks(self):
+        yield self.prefix
+        view = memoryview(self.image_bytes)
+        for start in range(0, len(view), BASE64_CHUNK_BYTES):
+            yield base64.b64encode(view[start:start + BASE64_CHUNK_BYTES])
+
+    def __str__(self):
+        return b"".join(self.iter_chunks()).decode("ascii")
+
+# Copy of messages with every ImageDataURL turned into a plain string, for SDK clients
+def materialize_messages(value):
+    if isinstance(value, ImageDataURL):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: materialize_messages(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [materialize_messages(item) for item in value]
+    return value
+
+def build_messages(image_bytes, prompt, mime_type):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": ImageDataURL(image_bytes, mime_type)
+                    }
+                }
+            ]
+        }
+    ]
+
+# One user message carrying the prompt and several (image_bytes, mime_type) pages
+def build_batch_messages(images, prompt):
+    content = [{"type": "text", "text": prompt + BATCH_PROMPT_SUFFIX.replace("{count}", str(len(images)))}]
+    for image_bytes, mime_type in images:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": ImageDataURL(image_bytes, mime_type)
+            }
+        })
+    return [{"role": "user", "content": content}]
+
+class VisionExtractor:
+    """
+    A vision model backend. Subclasses implement complete(messages, deadline), which
+    returns the raw model reply or raises; extract() turns that into a JSON string
+    and never raises. Backends that support streaming also implement
+    complete_stream(), used by stream().
+    """
+    name = "base"
+    model = ""
+
+    def complete(self, messages, deadline):
+        raise NotImplementedError
+
+    def extract_messages(self, messages, deadline=None):
+        try:
+            return clean_json_response(self.complete(messages, deadline))
+        except Exception:
+            return ERROR_RESULT
+
+    def extract(self, image_bytes, prompt, mime_type="image/jpeg", deadline=None):
+        return self.extract_messages(build_messages(image_bytes, prompt, mime_type), deadline)
+
+    def extract_batch(self, images, prompt, deadline=None):
+        """
+        Send several (image_bytes, mime_type) pages in one request and return the
+        single merged JSON object the model replies with.
+        """
+        return self.extract_messages(build_batch_messages(images, prompt), deadline)
+
+    # Yield the reply in text chunks; backends without streaming yield it in one piece
+    def complete_stream(self, messages, deadline):
+        yield self.complete(messages, deadline)
+
+    def stream(self, image_bytes, prompt, mime_type="image/jpeg", deadline=None, on_field=None, required_keys=()):
+        """
+        Like extract(), but parses the reply while it streams: on_field(key, value) is
+        called as each top-level field completes, and reading stops early once every
+        key in required_keys has a value or the reply has derailed. A reply cut off before
+        its object closes (e.g. at max_completion_tokens) is an error, as in extract().
+        """
+        if not STREAM_EXTRACTION:
+            result = self.extract(image_bytes, prompt, mime_type, deadline)
+            emit_fields(result, on_field)
+            return result
+        parser = IncrementalJSONParser()
+        chunks = self.complete_stream(build_messages(image_bytes, prompt, mime_type), deadline)
+        has_required = False
+        try:
+            for chunk in chunks:
+                for key, value in parser.feed(chunk):
+                    if on_field is not None:
+                        on_field(key, value)
+                if parser.finished or parser.derailed:
+                    break
+                if required_keys and parser.has_values_for(required_keys):
+                    has_required = True
+                    break
+        except Exception:
+            return ERROR_RESULT
+        finally:
+            chunks.close()
+        # Fields read before a truncated reply ended must not be accepted or cached
+        if parser.derailed or not (parser.finished or has_required):
+            return ERROR_RESULT
+        return parser.result()
+
+# Report every field of an already complete result to on_field
+def emit_fields(result, on_field):
+    if on_field is None:
+        return
+    try:
+        parsed = json.loads(result)
+    except (TypeError, json.JSONDecodeError):
+        return
+    if isinstance(parsed, dict) and "error" not in parsed:
+        for key, value in parsed.items():
+            on_field(key, value)
+
+class GroqExtractor(VisionExtractor):
+    name = "groq"
+
+    def __init__(self, model=None, api_key=None):
+        from groq import Groq
+        self.model = model or GROQ_MODEL
+        # Retries are handled by the scheduler, not the SDK
+        self.client = Groq(api_key=api_key or os.getenv("GROQ_API_KEY"), max_retries=0)
+
+    def complete(self, messages, deadline):
+        def create():
+            started = time.monotonic()
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=materialize_messages(messages),
+                temperature=0,
+                max_completion_tokens=1024,
+            )
+            _record_call(self.model, started, completion.usage)
+            return completion
+        completion = get_scheduler("groq").call(create, deadline)
+        return completion.choices[0].message.content
+
+    def complete_stream(self, messages, deadline):
+        started = time.monotonic()
+        usage = None
+        stream = get_scheduler("groq").call(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=materialize_messages(messages),
+                temperature=0,
+                max_completion_tokens=1024,
+                stream=True,
+            ),
+            deadline,
+        )
+        try:
+            for chunk in stream:
+                # Groq reports token usage on the last chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                    usage = x_groq.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+            # Replies abandoned early (all required fields seen) have no usage
+            _record_call(self.model, started, usage)
+
+class OpenRouterExtractor(VisionExtractor):
+    name = "openrouter"
+
+    def __init__(self, model=None, api_key=None, url=OPENROUTER_API_URL):
+        self.model = model or OPENROUTER_MODEL
+        self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+        self.url = url
+
+    # POST the chat completion through the pooled session, rate limited and retried
+    def _post(self, messages, deadline, stream=False):
+        from http_client import get_http_session, StreamingJSONBody
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0,
+            "max_tokens": 1024,
+            "stream": stream
+        }
+        def post():
+            # The body is serialized while it is sent, base64 encoding each image slice by slice
+            response = get_http_session().post(self.url, headers=headers, data=StreamingJSONBody(data), timeout=60, stream=stream)
+            response.raise_for_status()
+            return response
+        return get_scheduler("openrouter").call(post, deadline)
+
+    def complete(self, messages, deadline):
+        started = time.monotonic()
+        result = self._post(messages, deadline).json()
+        _record_call(self.model, started, result.get("usage"))
+        return result["choices"][0]["message"]["content"]
+
+    # Read the server-sent events of a streamed completion
+    def complete_stream(self, messages, deadline):
+        started = time.monotonic()
+        usage = None
+        with self._post(messages, deadline, stream=True) as response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        # Blank keep-alives and ": OPENROUTER PROCESSING" comments
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    event = json.loads(payload)
+                    # The final event carries the token usage
+                    usage = event.get("usage") or usage
+                    choices = event.get("choices") or []
+                    if choices and choices[0].get("delta", {}).get("content"):
+                        yield choices[0]["delta"]["content"]
+            finally:
+                _record_call(self.model, started, usage)
+
+class StubExtractor(VisionExtractor):
+    """
+    Offline backend for local runs and tests: returns a fixed reply after an optional delay.
+    """
+    name = "stub"
+
+    def __init__(self, response=None, delay=0.0, model=None):
+        self.model = model or "stub"
+        self.response = response if response is not None else os.getenv("STUB_EXTRACTION_RESPONSE", "{}")
+        self.delay = delay
+
+    def complete(self, messages, deadline):
+        started = time.monotonic()
+        if self.delay:
+            time.sleep(self.delay)
+        _record_call(self.model, started)
+        return self.response
+
+class HedgedExtractor(VisionExtractor):
+    """
+    Sends a page to the primary backend and, if it has not answered within the p95
+    of its recent latencies, also to the secondary; the first valid JSON wins.
+    """
+    name = "hedged"
+
+    def __init__(self, primary, secondary, max_workers=16):
+        self.primary = primary
+        self.secondary = secondary
+        self.model = f"{primary.model}|{secondary.model}"
+        self.latencies = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.hedged_calls = 0
+
+    def hedge_after(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_SECONDS
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _timed_primary(self, image_bytes, prompt, mime_type, deadline):
+        started = time.monotonic()
+        result = self.primary.extract(image_bytes, prompt, mime_type, deadline)
+        if is_valid_result(result):
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+        return result
+
+    def extract(self, image_bytes, prompt, mime_type="image/jpeg", deadline=None):
+        # Each request runs in a copy of this context so record_model_calls() sees it
+        primary = self.executor.submit(contextvars.copy_context().run, self._timed_primary, image_bytes, prompt, mime_type, deadline)
+        done, _ = wait([primary], timeout=self.hedge_after())
+        if done:
+            result = primary.result()
+            if is_valid_result(result):
+                return result
+            # The primary answered but failed: go straight to the secondary
+            return self.secondary.extract(image_bytes, prompt, mime_type, deadline)
+        with self.lock:
+            self.hedged_calls += 1
+        secondary = self.executor.submit(contextvars.copy_context().run, self.secondary.extract, image_bytes, prompt, mime_type, deadline)
+        pending = {primary, secondary}
+        result = ERROR_RESULT
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if is_valid_result(result):
+                    return result
+        return result
+
+    # Batched requests are not hedged; the secondary is only tried if the primary fails
+    def extract_messages(self, messages, deadline=None):
+        result = self.primary.extract_messages(messages, deadline)
+        if is_valid_result(result):
+            return result
+        return self.secondary.extract_messages(messages, deadline)
+
+    # Hedging needs whole replies to compare, so fields are reported once a reply wins
+    def stream(self, image_bytes, prompt, mime_type="image/jpeg", deadline=None, on_field=None, required_keys=()):
+        result = self.extract(image_bytes, prompt, mime_type, deadline)
+        emit_fields(result, on_field)
+        return result
+
+EXTRACTOR_CLASSES = {
+    "groq": GroqExtractor,
+    "openrouter": OpenRouterExtractor,
+    "stub": StubExtractor,
+}
+
+def build_extractor(provider, hedge_provider=None, model=None):
+    """
+    Create the extractor for a provider name, wrapped in a HedgedExtractor when a
+    different hedge_provider is given. model overrides the provider's default model.
+    """
+    if provider not in EXTRACTOR_CLASSES:
+        raise ValueError(f"Unknown extraction provider: {provider}")
+    extractor = EXTRACTOR_CLASSES[provider](model=model)
+    if hedge_provider and hedge_provider != provider:
+        if hedge_provider not in EXTRACTOR_CLASSES:
+            raise ValueError(f"Unknown hedge provider: {hedge_provider}")
+        extractor = HedgedExtractor(extractor, EXTRACTOR_CLASSES[hedge_provider]())
+    return extractor
@@ -0,0 +1,104 @@
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Minimum score for an extracted key to be assigned to a required key
+MATCH_THRESHOLD = 0.7
+# Without any shared token, only a very close spelling (e.g. "Anual" vs "Annual") is accepted
+FUZZY_THRESHOLD = 0.85
+
+# Lower-case, spell out "&" and split on anything that is not a letter or digit
+def tokenize(text):
+    return [t for t in re.split(r"[^a-z0-9]+", (text or "").lower().replace("&", " and ")) if t]
+
+def normalize_key(text):
+    return "".join(tokenize(text))
+
+class FieldMatcher:
+    """
+    Assign extracted JSON keys to a fixed list of required keys.
+    Everything derived from the required keys (normalized forms, token sets, the
+    token index) is built once in the constructor. Each extracted key is scored
+    against the required keys as: exact normalized match (or alias) first, then
+    candidates sharing a token, then a fuzzy spelling fallback over all keys.
+    Assignment is global and greedy by score, so every required key gets its best
+    extracted key and no extracted key fills two required keys.
+    """
+    def __init__(self, required_keys, aliases=None, cache_size=4096):
+        self.required_keys = list(required_keys)
+        self._exact = {}
+        self._tokens = {}
+        self._normalized = {}
+        self._token_index = {}
+        for req_key in self.required_keys:
+            names = [req_key] + list((aliases or {}).get(req_key, []))
+            for name in names:
+                self._exact.setdefault(normalize_key(name), req_key)
+            self._normalized[req_key] = [normalize_key(name) for name in names]
+            self._tokens[req_key] = [frozenset(tokenize(name)) for name in names]
+            for token_set in self._tokens[req_key]:
+                for token in token_set:
+                    self._token_index.setdefault(token, set()).add(req_key)
+        self._order = {k: i for i, k in enumerate(self.required_keys)}
+        self.score_key = lru_cache(maxsize=cache_size)(self._score_key)
+
+    # Score one extracted key against its candidate required keys: [(score, required_key), ...]
+    def _score_key(self, extracted_key):
+        normalized = normalize_key(extracted_key)
+        if not normalized:
+            return ()
+        exact = self._exact.get(normalized)
+        if exact is not None:
+            return ((1.0, exact),)
+        tokens = frozenset(tokenize(extracted_key))
+        candidates = set()
+        for token in tokens:
+            candidates |= self._token_index.get(token, set())
+        scores = []
+        if candidates:
+            for req_key in candidates:
+                best = 0.0
+                for req_tokens, req_normalized in zip(self._tokens[req_key], self._normalized[req_key]):
+                    dice = 2 * len(tokens & req_tokens) / (len(tokens) + len(req_tokens))
+                    ratio = SequenceMatcher(None, normalized, req_normalized).ratio()
+                    best = max(best, 0.6 * dice + 0.4 * ratio)
+                if best >= MATCH_THRESHOLD:
+                    scores.append((best, req_key))
+        else:
+            for req_key in self.required_keys:
+                ratio = max(SequenceMatcher(None, normalized, n).ratio() for n in self._normalized[req_key])
+                if ratio >= FUZZY_THRESHOLD:
+                    scores.append((ratio, req_key))
+        return tuple(sorted(scores, key=lambda item: (-item[0], self._order[item[1]])))
+
+    def match_keys(self, extracted_json):
+        """
+        Given the extracted JSON, return {required key: extracted key} for the required
+        keys that matched; each extracted key is assigned to at most one required key.
+        """
+        assigned = {}
+        if not extracted_json:
+            return assigned
+        pairs = []
+        for position, (key, value) in enumerate(extracted_json.items()):
+            if value is None or value == "" or not isinstance(key, str):
+                continue
+            for score, req_key in self.score_key(key):
+                pairs.append((-score, position, self._order[req_key], req_key, key))
+        used_positions = set()
+        for _, position, _, req_key, key in sorted(pairs, key=lambda p: p[:3]):
+            if req_key in assigned or position in used_positions:
+                continue
+            assigned[req_key] = key
+            used_positions.add(position)
+        return assigned
+
+    def match(self, extracted_json):
+        """
+        Given the extracted JSON, return a dict with every required key and the value
+        of its best-scoring extracted key (None when nothing matched).
+        """
+        autofill = {k: None for k in self.required_keys}
+        for req_key, key in self.match_keys(extracted_json).items():
+            autofill[req_key] = extracted_json[key]
+        return autofill
@@ -0,0 +1,316 @@
+import re
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+from field_matcher import FieldMatcher, tokenize
+
+# Field value validators: return an error message, or None when the value is acceptable.
+# Empty values are always accepted here; the model and operators leave unknown fields blank.
+def _digits(value):
+    return re.sub(r"\D", "", value)
+
+def validate_date(value):
+    if not re.search(r"\d", value):
+        return "should contain a date"
+
+def validate_phone(value):
+    if not 7 <= len(_digits(value)) <= 15:
+        return "should be a phone number with 7 to 15 digits"
+
+def validate_cnic_new(value):
+    if len(_digits(value)) != 13:
+        return "should be a 13 digit CNIC (e.g. 42101-1234567-1)"
+
+def validate_cnic_old(value):
+    if len(_digits(value)) != 11:
+        return "should be an 11 digit NIC"
+
+def validate_number(value):
+    if not re.fullmatch(r"[\d,.\s]*\d[\d,.\s]*(?:[A-Za-z/ ]*)", value.strip()):
+        return "should be a number"
+
+def validate_email_or_web(value):
+    if "@" not in value and "." not in value:
+        return "should be an email address or website"
+
+def validate_account(value):
+    if len(re.sub(r"[^0-9A-Za-z]", "", value)) < 6:
+        return "should be an account number or IBAN"
+
+VALIDATORS_BY_TYPE = {
+    "date": (validate_date,),
+    "phone": (validate_phone,),
+    "cnic_new": (validate_cnic_new,),
+    "cnic_old": (validate_cnic_old,),
+    "number": (validate_number,),
+    "email_web": (validate_email_or_web,),
+    "account": (validate_account,),
+}
+
+@dataclass(frozen=True)
+class FormField:
+    """
+    One field of a form: the exact key name the model is asked to use, other
+    spellings it commonly returns, a value type, extra validators and the key it
+    is stored under (by default the name in snake case).
+    """
+    name: str
+    aliases: tuple = ()
+    type: str = "text"
+    validators: tuple = ()
+    key: str = ""
+
+    # e.g. "Banker Name & Branch" -> "banker_name_and_branch"
+    @property
+    def storage_key(self):
+        return self.key or "_".join(tokenize(self.name))
+
+    def validate(self, value):
+        if value is None or str(value).strip() == "":
+            return []
+        checks = VALIDATORS_BY_TYPE.get(self.type, ()) + tuple(self.validators)
+        return [error for error in (check(str(value)) for check in checks) if error]
+
+class FormSchema:
+    """
+    A form type defined once: its fields and prompt template. The prompt text,
+    field list and key matcher are derived from it the first time they are used
+    and then reused for every page and every Streamlit rerun.
+    """
+    def __init__(self, form_type, title, fields, prompt_template):
+        self.form_type = form_type
+        self.title = title
+        self.fields = tuple(fields)
+        self.prompt_template = prompt_template
+
+    @cached_property
+    def field_names(self):
+        return tuple(f.name for f in self.fields)
+
+    @cached_property
+    def prompt(self):
+        field_list = "\n".join(f'- "{name}"' for name in self.field_names)
+        return self.prompt_template.replace("{field_list}", field_list)
+
+    # Changes whenever the prompt text does, so stored results can be traced to the prompt used
+    @cached_property
+    def prompt_version(self):
+        return hashlib.sha256(self.prompt.encode("utf-8")).hexdigest()[:12]
+
+    @cached_property
+    def storage_keys(self):
+        return {f.name: f.storage_key for f in self.fields}
+
+    @cached_property
+    def matcher(self):
+        return FieldMatcher(self.field_names, {f.name: f.aliases for f in self.fields if f.aliases})
+
+    def validate(self, values):
+        """
+        Return {field name: [error, ...]} for the fields of values that fail validation.
+        """
+        errors = {}
+        for form_field in self.fields:
+            field_errors = form_field.validate(values.get(form_field.name))
+            if field_errors:
+                errors[form_field.name] = field_errors
+        return errors
+
+FORM_SCHEMAS = {}
+
+def register_form_schema(schema):
+    FORM_SCHEMAS[schema.form_type] = schema
+    return schema
+
+def get_form_schema(form_type):
+    if form_type not in FORM_SCHEMAS:
+        raise KeyError(f"Unknown form type: {form_type}")
+    return FORM_SCHEMAS[form_type]
+
+# Prompt for a generic form; {field_list} is replaced with the schema's key names
+GENERAL_PROMPT_TEMPLATE = '''<role>You are an expert OCR and form data extraction specialist.</role>
+<task>
+Extract ALL visible information from this form image and return it as a valid JSON object with key-value pairs.
+If you find any of the following fields, use these exact key names in your JSON:
+{field_list}
+If a field is not present, set its value to null.
+</task>
+<instructions>
+1. MANDATORY: Your response MUST be a valid JSON object only - no additional text, explanations, or formatting
+2. Extract both handwritten and printed text accurately
+3. For checkboxes/tick marks: identify selected options and include them as boolean values
+4. For empty/blank fields: use null as the value
+5. Preserve exact formatting for phone numbers, dates, and identification numbers
+6. For addresses: capture complete address as single string value
+</instructions>
+<guardrails>
+- NEVER include explanatory text before or after the JSON
+- NEVER use markdown code blocks or backticks
+- NEVER hallucinate or infer data not visible in the image
+- ALWAYS use double quotes for JSON strings
+- ALWAYS ensure valid JSON syntax
+- IF uncertain about a value, use null instead of guessing
+</guardrails>
+<examples>
+Good response: {"Date": "2025-07-09", "Merchant Name Commercial": "ABC Store", "Telephone": "1234567890", "Business Address Commercial": "123 Main St", "City": "Karachi", "Anual Sales Volume": "100000", "Average Transaction size": "5000"}
+Bad response: json {"Date": "2025-07-09"} or "Here is the extracted data: {..."
+</examples>
+'''
+
+# Prompt that first checks the page is a merchant application form
+MERCHANT_PROMPT_TEMPLATE = '''<role>You are an expert OCR and form data extraction specialist.</role>
+<task>
+From this image, determine if it belongs to a **Merchant Application Form**. 
+Only if it is a valid Merchant Application Form, extract **all visible information** from it and return it as a valid JSON object with key-value pairs. 
+
+If the image does **not** contain a Merchant Application Form, return exactly this JSON:
+{"form_type": "not_merchant_form"}
+</task>
+
+<form_identification>
+To identify a valid Merchant Application Form, look for keywords such as:
+- "Merchant Application Form"
+- "Merchant Name", "Business Address", "Account", "NIC", "Legal Structure", etc.
+- Typical form layout with labeled fields and handwritten or typed responses
+If these are not present, treat it as an irrelevant form or image.
+</form_identification>
+
+<instructions>
+1. ONLY return data if the image contains a merchant application form
+2. If it's a merchant application form, extract every visible field from it
+3. Your response MUST be a valid JSON object only — no markdown, no text before or after
+4. Use these **exact key names** when matching fields:
+{field_list}
+If a field is missing or unreadable, return its value as `null`.
+</instructions>
+
+<formatting>
+- NEVER use markdown or backticks
+- ALWAYS return a plain JSON object
+- ALWAYS ensure valid JSON syntax with double quotes
+- NEVER hallucinate or assume field values
+- ALWAYS use `null` if uncertain
+</formatting>
+<examples>
+Good response: {"Date": "2025-07-09", "Merchant Name Commercial": "ABC Store", "Telephone": "1234567890", "Business Address Commercial": "123 Main St", "City": "Karachi", "Anual Sales Volume": "100000", "Average Transaction size": "5000"}
+Bad response: json {"Date": "2025-07-09"} or "Here is the extracted data: {..."
+</examples>
+'''
+
+# Fields shared by the merchant application form definitions
+_DATE = FormField("Date", type="date")
+_MERCHANT_NAME_COMMERCIAL = FormField("Merchant Name Commercial", ("DBA Name", "Trading Name"))
+_MERCHANT_NAME_LEGAL = FormField("Merchant Name legal", ("Legal Name",))
+_BUSINESS_ADDRESS_COMMERCIAL = FormField("Business Address Commercial")
+_CITY = FormField("City")
+_AVERAGE_TRANSACTION_SIZE = FormField("Average Transaction size", ("Average Ticket Size",), type="number")
+_LEGAL_STRUCTURE = FormField("Legal Structure")
+_FIRST_NAME = FormField("First Name")
+_LAST_NAME = FormField("Last Name")
+_PAYMENT_MODE = FormField("Payment Mode")
+
+register_form_schema(FormSchema(
+    "general_form",
+    "General Form",
+    [
+        _DATE,
+        _MERCHANT_NAME_COMMERCIAL,
+        _MERCHANT_NAME_LEGAL,
+        _BUSINESS_ADDRESS_COMMERCIAL,
+        _CITY,
+        FormField("Telephone", ("Telephone / Cell", "Cell", "Phone", "Mobile"), type="phone", key="telephone"),
+        FormField("Anual Sales Volume", ("Annual Sales Volume",), type="number", key="annual_sales_volume"),
+        _AVERAGE_TRANSACTION_SIZE,
+        _LEGAL_STRUCTURE,
+        _FIRST_NAME,
+        _LAST_NAME,
+        FormField("NIC New", ("CNIC", "NIC (New)"), type="cnic_new"),
+        _PAYMENT_MODE,
+        FormField("Banker Name and Branch", ("Banker Name & Branch", "Bank Name and Branch")),
+        FormField("Account", ("Account/IBAN", "Account Number", "IBAN"), type="account", key="account"),
+    ],
+    GENERAL_PROMPT_TEMPLATE,
+))
+
+register_form_schema(FormSchema(
+    "merchant_application_basic",
+    "Merchant Application Form (basic)",
+    [
+        _DATE,
+        FormField("New Outlet"),
+        FormField("Chain Outlet"),
+        _MERCHANT_NAME_COMMERCIAL,
+        _MERCHANT_NAME_LEGAL,
+        FormField("Established Since", type="date"),
+        _BUSINESS_ADDRESS_COMMERCIAL,
+        _CITY,
+        FormField("Telephone / Cell", ("Telephone", "Cell", "Phone", "Mobile"), type="phone", key="telephone"),
+        FormField("Contact Person Name", ("Contact Person",)),
+        FormField("Business Address Legal"),
+        FormField("Type of Business/Type of Merchandise/Service Sold", ("Type of Business", "Nature of Business"), key="type_of_business"),
+        FormField("Annual Sales Volume", ("Anual Sales Volume",), type="number"),
+        _AVERAGE_TRANSACTION_SIZE,
+        FormField("Expected Volume", type="number"),
+        _LEGAL_STRUCTURE,
+        _FIRST_NAME,
+        _LAST_NAME,
+        FormField("NIC (Old)", ("Old NIC",), type="cnic_old"),
+        FormField("NIC New", ("CNIC", "NIC (New)"), type="cnic_new"),
+        FormField("Residence Address"),
+        _PAYMENT_MODE,
+        FormField("Banker Name and Branch", ("Banker Name & Branch", "Bank Name and Branch")),
+        FormField("Account", ("Account/IBAN", "Account Number", "IBAN"), type="account", key="account"),
+        FormField("Merchant Cheaque Beneficiary Name", ("Merchant Cheque Beneficiary Name",)),
+    ],
+    GENERAL_PROMPT_TEMPLATE,
+))
+
+register_form_schema(FormSchema(
+    "merchant_application",
+    "Merchant Application Form",
+    [
+        _DATE,
+        FormField("MID", ("Merchant ID",)),
+        FormField("TID", ("Terminal ID",)),
+        FormField("New Outlet"),
+        FormField("Chain Outlet"),
+        _MERCHANT_NAME_COMMERCIAL,
+        _MERCHANT_NAME_LEGAL,
+        FormField("Established Since", type="date"),
+        _BUSINESS_ADDRESS_COMMERCIAL,
+        _CITY,
+        FormField("Telephone / Cell", ("Telephone", "Cell", "Phone", "Mobile"), type="phone", key="telephone"),
+        FormField("Email/Web", ("Email", "Website", "Web"), key="email_web"),
+        FormField("Contact Person Name", ("Contact Person",)),
+        FormField("Business Address Legal"),
+        FormField("Number of Outlets", type="number"),
+        FormField("Location of Branches"),
+        FormField("Type of Business/Type of Merchandise/Service Sold", ("Type of Business", "Nature of Business"), key="type_of_business"),
+        FormField("Annual Sales Volume", ("Anual Sales Volume",), type="number"),
+        _AVERAGE_TRANSACTION_SIZE,
+        FormField("Expected Volume", type="number"),
+        _LEGAL_STRUCTURE,
+        _FIRST_NAME,
+        _LAST_NAME,
+        FormField("NIC (Old)", ("Old NIC",), type="cnic_old"),
+        FormField("NIC New", ("CNIC", "NIC (New)"), type="cnic_new"),
+        FormField("Residence Address"),
+        FormField("Authorized Signatory First Name"),
+        FormField("Authorized Signatory Last Name"),
+        FormField("Authorized Signatory NIC(Old)", type="cnic_old"),
+        FormField("Authorized Signatory NIC(New)", ("Authorized Signatory CNIC",), type="cnic_new"),
+        _PAYMENT_MODE,
+        FormField("Banker Name & Branch", ("Banker Name and Branch", "Bank Name and Branch")),
+        FormField("Account/IBAN", ("Account", "Account Number", "IBAN"), type="account", key="account"),
+        FormField("Merchant Cheaque Beneficiary Name", ("Merchant Cheque Beneficiary Name",)),
+        FormField("Merchant Cheaque Beneficiary Address", ("Merchant Cheque Beneficiary Address",)),
+        FormField("Do You want Direct Credit Facility with UBL", ("Direct Credit Facility",), key="direct_credit_facility"),
+        FormField("If any previous Credit Card acceptance relationship", ("Previous Credit Card Acceptance Relationship",), key="previous_card_relationship"),
+        FormField("If yes, with", key="previous_card_acquirer"),
+        FormField("Current Status of Relationship"),
+        FormField("If active, what equipment is already in place", key="existing_equipment"),
+        FormField("If Terminated Reason of Termination", ("Reason of Termination",), key="termination_reason"),
+        FormField("Discount Rates Offered", ("Discount Rate",)),
+    ],
+    MERCHANT_PROMPT_TEMPLATE,
+))
@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from pipeline import MAX_CONCURRENT_EXTRACTIONS
+from jobs import JOB_WORKERS
+
+# Documents one process extracts at a time: its job workers, or API_WORKERS (default 4) in the HTTP service
+DOCUMENT_WORKERS = max(JOB_WORKERS, int(os.getenv("API_WORKERS", "4")))
+# Connection pool size per host; defaults to every request the process can have in flight
+# (documents at a time x requests per document) so each can reuse a kept-alive connection
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(max(1, DOCUMENT_WORKERS) * MAX_CONCURRENT_EXTRACTIONS)))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Return the process-wide keep-alive requests.Session shared by all extraction calls.
+    The session is created on first use so DNS, TCP and TLS setup happen once per host.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+# Compact JSON for everything that is not streamed
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+# Yield the JSON encoding of value; objects with iter_chunks() are written as strings chunk by chunk
+def _iter_json(value):
+    if hasattr(value, "iter_chunks"):
+        yield b'"'
+        yield from value.iter_chunks()
+        yield b'"'
+    elif isinstance(value, dict):
+        yield b"{"
+        for index, (key, item) in enumerate(value.items()):
+            yield (b"," if index else b"") + _dumps(str(key)) + b":"
+            yield from _iter_json(item)
+        yield b"}"
+    elif isinstance(value, (list, tuple)):
+        yield b"["
+        for index, item in enumerate(value):
+            if index:
+                yield b","
+            yield from _iter_json(item)
+        yield b"]"
+    else:
+        yield _dumps(value)
+
+# Byte length of _iter_json(value), computed without encoding the streamed values
+def _json_length(value):
+    if hasattr(value, "iter_chunks"):
+        return 2 + len(value)
+    if isinstance(value, dict):
+        return 2 + max(0, len(value) - 1) + sum(len(_dumps(str(key))) + 1 + _json_length(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 + max(0, len(value) - 1) + sum(_json_length(item) for item in value)
+    return len(_dumps(value))
+
+class StreamingJSONBody:
+    """
+    A JSON request body that is serialized while requests sends it. Values with an
+    iter_chunks() method (and a len() of their encoded size, such as
+    extractors.ImageDataURL) are written out as JSON strings one chunk at a time, and
+    their chunk bytes must not need JSON escaping. len() is the exact body size, so the
+    request goes out with a Content-Length instead of chunked encoding, and the body
+    can be iterated again when a request is retried.
+    """
+    def __init__(self, payload):
+        self.payload = payload
+        self.length = _json_length(payload)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return _iter_json(self.payload)
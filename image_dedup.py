@@ -0,0 +1,137 @@
+import os
+import io
+import hashlib
+import numpy as np
+from PIL import Image, ImageOps, ImageFilter
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Collapse duplicate and near-duplicate images before extraction
+IMAGE_DEDUP = os.getenv("IMAGE_DEDUP", "true").lower() in ("1", "true", "yes")
+# Candidate near duplicates have aHash and dHash differing in at most this many bits in total
+# (copies of one page differ by 0-3; different text pages can be as close as 0-5, hence the overlap check)
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "6"))
+# Candidates are only duplicates if this fraction of their ink pixels coincide (Jaccard overlap);
+# a rescaled or recompressed copy of a page scores about 0.98, different text pages up to about 0.94
+DUPLICATE_MIN_OVERLAP = float(os.getenv("DUPLICATE_MIN_OVERLAP", "0.97"))
+# Side of the aHash grid (dHash uses one extra column)
+HASH_SIZE = 8
+# Width of the ink bitmap compared between candidates, and the gray level below which a pixel is ink
+INK_MAP_WIDTH = 128
+INK_LEVEL = 160
+
+def perceptual_hashes(image_bytes):
+    """
+    Return (aHash, dHash, pixel count, ink bitmap) of an image, each hash a
+    HASH_SIZE * HASH_SIZE bit integer computed over a downsampled grayscale copy and the
+    bitmap an INK_MAP_WIDTH wide boolean array of dark pixels, or None if it cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            pixel_count = img.width * img.height
+            # Let JPEG decode at a reduced scale; the bitmap only needs a few hundred pixels across
+            img.draft("L", (INK_MAP_WIDTH * 4, INK_MAP_WIDTH * 4))
+            gray = ImageOps.exif_transpose(img).convert("L")
+    except Exception:
+        return None
+    # Spread dark pixels before shrinking so text strokes stay ink in the bitmap
+    ink_source = gray.copy()
+    ink_source.thumbnail((INK_MAP_WIDTH * 4, INK_MAP_WIDTH * 4))
+    ink_source = ink_source.filter(ImageFilter.MinFilter(3))
+    ink_height = max(1, round(INK_MAP_WIDTH * ink_source.height / ink_source.width))
+    ink_map = np.asarray(ink_source.resize((INK_MAP_WIDTH, ink_height), Image.BILINEAR)) < INK_LEVEL
+    average_pixels = list(gray.resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR).getdata())
+    mean = sum(average_pixels) / len(average_pixels)
+    ahash = 0
+    for value in average_pixels:
+        ahash = (ahash << 1) | (value > mean)
+    difference_pixels = list(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+    dhash = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = difference_pixels[row * (HASH_SIZE + 1) + col]
+            dhash = (dhash << 1) | (left > difference_pixels[row * (HASH_SIZE + 1) + col + 1])
+    return ahash, dhash, pixel_count, ink_map
+
+def hash_distance(first, second):
+    return bin(first[0] ^ second[0]).count("1") + bin(first[1] ^ second[1]).count("1")
+
+# Fraction of the ink pixels of either image that both share; pages of different shapes never match
+def ink_overlap(first, second):
+    if first[3].shape != second[3].shape:
+        return 0.0
+    union = np.count_nonzero(first[3] | second[3])
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(first[3] & second[3]) / union
+
+def is_near_duplicate(first, second, max_distance=None):
+    max_distance = DUPLICATE_MAX_DISTANCE if max_distance is None else max_distance
+    return hash_distance(first, second) <= max_distance and ink_overlap(first, second) >= DUPLICATE_MIN_OVERLAP
+
+def dedupe_images(images):
+    """
+    Given a list of image bytes, return the indexes of the images to extract, in order:
+    one per group of exact or near duplicates (a thumbnail plus the full scan, a page
+    scanned twice), the copy with the highest resolution.
+    """
+    if not IMAGE_DEDUP:
+        return list(range(len(images)))
+    seen_digests = set()
+    # [index of the best copy so far, its hashes] per group
+    groups = []
+    undecodable = []
+    for index, image_bytes in enumerate(images):
+        digest = hashlib.sha256(image_bytes).digest()
+        if digest in seen_digests:
+            continue
+        seen_digests.add(digest)
+        image_hash = perceptual_hashes(image_bytes)
+        if image_hash is None:
+            undecodable.append(index)
+            continue
+        for group in groups:
+            if is_near_duplicate(image_hash, group[1]):
+                if image_hash[2] > group[1][2]:
+                    group[0], group[1] = index, image_hash
+                break
+        else:
+            groups.append([index, image_hash])
+    return sorted([group[0] for group in groups] + undecodable)
+
+class Deduplicator:
+    """
+    Spots exact and near-duplicate images in a stream of pages that are not all in
+    memory (lazily rendered PDFs), remembering only their hashes. A later copy is a
+    duplicate unless it has a higher resolution than the copy already seen, in which
+    case it is sent too and becomes the copy later pages are compared with; image
+    lists use dedupe_images, which keeps only the best copy.
+    """
+    def __init__(self, max_distance=None):
+        self.max_distance = DUPLICATE_MAX_DISTANCE if max_distance is None else max_distance
+        self.seen_digests = set()
+        self.seen_hashes = []
+        self.duplicates = 0
+
+    def is_duplicate(self, image_bytes):
+        if not IMAGE_DEDUP:
+            return False
+        digest = hashlib.sha256(image_bytes).digest()
+        if digest in self.seen_digests:
+            self.duplicates += 1
+            return True
+        self.seen_digests.add(digest)
+        image_hash = perceptual_hashes(image_bytes)
+        if image_hash is None:
+            return False
+        for index, other in enumerate(self.seen_hashes):
+            if is_near_duplicate(image_hash, other, self.max_distance):
+                if image_hash[2] <= other[2]:
+                    self.duplicates += 1
+                    return True
+                self.seen_hashes[index] = image_hash
+                return False
+        self.seen_hashes.append(image_hash)
+        return False
@@ -0,0 +1,90 @@
+import json
+
+# Replies that have not opened a JSON object after this many characters are treated as derailed
+MAX_PREAMBLE_CHARS = 500
+
+class IncrementalJSONParser:
+    """
+    Parse a streamed model reply that should contain one flat JSON object.
+    feed() accepts text chunks as they arrive and returns the top-level
+    (key, value) pairs completed by that chunk, so fields can be used before
+    the reply ends. finished is set when the object closes; derailed is set
+    when the reply clearly is not going to be a valid JSON object.
+    """
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.started = False
+        self.finished = False
+        self.derailed = False
+        self.fields = {}
+
+    def feed(self, chunk):
+        completed = []
+        if self.finished or self.derailed or not chunk:
+            return completed
+        self.text += chunk
+        text = self.text
+        while self.pos < len(text):
+            i = self.pos
+            ch = text[i]
+            self.pos += 1
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.item_start = self.pos
+                elif i >= MAX_PREAMBLE_CHARS:
+                    self.derailed = True
+                    break
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._finish_item(text[self.item_start:i], completed)
+                    self.finished = True
+                    break
+            elif ch == "," and self.depth == 1:
+                self._finish_item(text[self.item_start:i], completed)
+                self.item_start = self.pos
+            if self.derailed:
+                break
+        return completed
+
+    # Parse one '"key": value' member and record it
+    def _finish_item(self, item, completed):
+        if not item.strip():
+            return
+        try:
+            parsed = json.loads("{" + item + "}")
+        except json.JSONDecodeError:
+            self.derailed = True
+            return
+        for key, value in parsed.items():
+            self.fields[key] = value
+            completed.append((key, value))
+
+    def has_values_for(self, keys):
+        """
+        True when every key has arrived with a non-null, non-empty value.
+        """
+        return all(self.fields.get(k) not in (None, "") for k in keys)
+
+    def result(self):
+        return json.dumps(self.fields, ensure_ascii=False)
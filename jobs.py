@@ -0,0 +1,322 @@
+"""
+Background extraction jobs: an upload is queued as a job, worker threads run the
+app's extraction pipeline on it and the UI polls the job for per-page progress.
+
+The Streamlit apps start JOB_WORKERS worker threads in their own process. Workers
+can also run separately (and be scaled independently of UI sessions) against the
+shared SQLite queue:
+
+    python jobs.py --app main7 --workers 4
+
+JOB_BACKEND=memory keeps jobs in process memory instead, for local runs and tests;
+it cannot be shared with separate worker processes.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import argparse
+import importlib
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "sqlite").lower()
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", ".jobs.sqlite3")
+# Worker threads each app process runs; 0 leaves the queue to separate `python jobs.py` workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# How often idle workers look for new jobs and the UI refreshes a running job
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# A running job without progress for this long is assumed lost with its worker and queued again
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# Finished jobs are purged after this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_JOB_COLUMNS = (
+    "id", "queue", "status", "file_name", "file_type", "file_hash",
+    "total_pages", "done_pages", "fields", "result", "error", "created_at", "updated_at",
+)
+
+class SQLiteJobStore:
+    """
+    Job queue and job state in one SQLite table, shared by every thread of the
+    process and by worker processes using the same database file.
+    """
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path or JOB_DB_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, queue TEXT NOT NULL, status TEXT NOT NULL, "
+            "file_name TEXT, file_type TEXT, file_hash TEXT, file_bytes BLOB, "
+            "total_pages INTEGER NOT NULL DEFAULT 0, done_pages INTEGER NOT NULL DEFAULT 0, "
+            "fields TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue_status ON jobs (queue, status, created_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue_hash ON jobs (queue, file_hash)")
+
+    def _row_to_job(self, row, with_bytes=False):
+        job = dict(zip(_JOB_COLUMNS, row))
+        job["fields"] = json.loads(job["fields"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if with_bytes:
+            job["file_bytes"] = row[len(_JOB_COLUMNS)]
+        return job
+
+    def enqueue(self, queue_name, file_name, file_type, file_bytes):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, now - JOB_RETENTION_SECONDS),
+            )
+            self.connection.execute(
+                "INSERT INTO jobs (id, queue, status, file_name, file_type, file_hash, file_bytes, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, queue_name, QUEUED, file_name, file_type, hashlib.sha256(file_bytes).hexdigest(), file_bytes, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    # The newest job of an identical upload that has not failed, or None
+    def find_job(self, queue_name, file_hash):
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE queue = ? AND file_hash = ? AND status != ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (queue_name, file_hash, FAILED),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self, queue_name):
+        """
+        Atomically take the oldest queued (or stale running) job of a queue and mark it
+        running. Returns the job including its file_bytes, or None if the queue is empty.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    f"SELECT {', '.join(_JOB_COLUMNS)}, file_bytes FROM jobs "
+                    "WHERE queue = ? AND (status = ? OR (status = ? AND updated_at < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (queue_name, QUEUED, RUNNING, now - JOB_STALE_SECONDS),
+                ).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE jobs SET status = ?, done_pages = 0, updated_at = ? WHERE id = ?",
+                        (RUNNING, now, row[0]),
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_job(row, with_bytes=True)
+        job["status"] = RUNNING
+        return job
+
+    def update_progress(self, job_id, done_pages, total_pages, fields):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET done_pages = ?, total_pages = ?, fields = ?, updated_at = ? WHERE id = ?",
+                (done_pages, total_pages, json.dumps(fields), time.time(), job_id),
+            )
+
+    # Record the outcome; the uploaded bytes are dropped as they are no longer needed
+    def finish(self, job_id, result):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, file_bytes = NULL, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, file_bytes = NULL, updated_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id),
+            )
+
+class MemoryJobStore:
+    """
+    In-process stand-in for SQLiteJobStore with the same methods; jobs are lost when
+    the process exits and are not visible to other processes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    # Copy of a job without its file bytes, so callers never share mutable state
+    def _public(self, job):
+        public = {key: job[key] for key in _JOB_COLUMNS}
+        public["fields"] = dict(job["fields"])
+        return public
+
+    def enqueue(self, queue_name, file_name, file_type, file_bytes):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            for old_id in [i for i, job in self.jobs.items() if job["status"] in (DONE, FAILED) and job["updated_at"] < now - JOB_RETENTION_SECONDS]:
+                del self.jobs[old_id]
+            self.jobs[job_id] = {
+                "id": job_id, "queue": queue_name, "status": QUEUED, "file_name": file_name,
+                "file_type": file_type, "file_hash": hashlib.sha256(file_bytes).hexdigest(),
+                "file_bytes": file_bytes, "total_pages": 0, "done_pages": 0, "fields": {},
+                "result": None, "error": None, "created_at": now, "updated_at": now,
+            }
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def find_job(self, queue_name, file_hash):
+        with self.lock:
+            matches = [
+                job for job in self.jobs.values()
+                if job["queue"] == queue_name and job["file_hash"] == file_hash and job["status"] != FAILED
+            ]
+            return self._public(max(matches, key=lambda job: job["created_at"])) if matches else None
+
+    def claim(self, queue_name):
+        now = time.time()
+        with self.lock:
+            waiting = [
+                job for job in self.jobs.values()
+                if job["queue"] == queue_name and (
+                    job["status"] == QUEUED or (job["status"] == RUNNING and job["updated_at"] < now - JOB_STALE_SECONDS)
+                )
+            ]
+            if not waiting:
+                return None
+            job = min(waiting, key=lambda job: job["created_at"])
+            job.update(status=RUNNING, done_pages=0, updated_at=now)
+            claimed = self._public(job)
+            claimed["file_bytes"] = job["file_bytes"]
+            return claimed
+
+    def update_progress(self, job_id, done_pages, total_pages, fields):
+        with self.lock:
+            self.jobs[job_id].update(done_pages=done_pages, total_pages=total_pages, fields=dict(fields), updated_at=time.time())
+
+    def finish(self, job_id, result):
+        with self.lock:
+            self.jobs[job_id].update(status=DONE, result=result, file_bytes=None, updated_at=time.time())
+
+    def fail(self, job_id, error):
+        with self.lock:
+            self.jobs[job_id].update(status=FAILED, error=error, file_bytes=None, updated_at=time.time())
+
+JOB_STORE_CLASSES = {
+    "sqlite": SQLiteJobStore,
+    "memory": MemoryJobStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_job_store():
+    """
+    Return the process-wide job store for JOB_BACKEND, created on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if JOB_BACKEND not in JOB_STORE_CLASSES:
+                    raise ValueError(f"Unknown job backend: {JOB_BACKEND}")
+                _store = JOB_STORE_CLASSES[JOB_BACKEND]()
+    return _store
+
+def run_job(store, job, handler):
+    """
+    Run handler(job, progress) for a claimed job and record its result, or its error
+    if the handler raises. progress(done_pages, total_pages, fields) updates the job.
+    """
+    def progress(done_pages, total_pages, fields):
+        store.update_progress(job["id"], done_pages, total_pages, fields)
+    try:
+        result = handler(job, progress)
+    except Exception as e:
+        store.fail(job["id"], str(e) or type(e).__name__)
+        return
+    store.finish(job["id"], result)
+
+class JobWorkerPool:
+    """
+    Worker threads that claim the jobs of one queue and run handler(job, progress) on them.
+    """
+    def __init__(self, store, queue_name, handler, workers=None, poll_seconds=None):
+        self.store = store
+        self.queue_name = queue_name
+        self.handler = handler
+        self.workers = JOB_WORKERS if workers is None else workers
+        self.poll_seconds = JOB_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{self.queue_name}-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while not self.stopped.is_set():
+            try:
+                job = self.store.claim(self.queue_name)
+            except sqlite3.OperationalError:
+                # The database is busy with another process; try again on the next poll
+                job = None
+            if job is None:
+                self.stopped.wait(self.poll_seconds)
+                continue
+            run_job(self.store, job, self.handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run extraction job workers for one app outside Streamlit.")
+    parser.add_argument("--app", default="main7", help="app module whose JOB_QUEUE and process_job are used")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS), help="number of worker threads")
+    args = parser.parse_args()
+    if JOB_BACKEND == "memory":
+        print("JOB_BACKEND=memory cannot be shared with the app; use the SQLite backend.", file=sys.stderr)
+        sys.exit(2)
+    app = importlib.import_module(args.app)
+    pool = JobWorkerPool(get_job_store(), app.JOB_QUEUE, app.process_job, args.workers).start()
+    print(f"{args.workers} worker(s) processing the {app.JOB_QUEUE} queue in {JOB_DB_PATH}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
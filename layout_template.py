@@ -0,0 +1,316 @@
+"""
+Layout templates: the field bounding boxes of a fixed-layout form, registered once
+per form type and used to re-read single fields from small crops of the page.
+
+A template is a JSON file LAYOUT_TEMPLATE_DIR/<form_type>.json:
+
+    {
+        "pages": [
+            {
+                "reference_image": "merchant_application_p1.png",
+                "anchors": [[x0, y0, x1, y1], ...],
+                "regions": {"Date": [x0, y0, x1, y1], "MID": [...], ...}
+            }
+        ]
+    }
+
+Boxes are in pixels of the reference image (a clean, straight scan of the blank or
+filled form, relative to the JSON file). Anchors are printed marks that never change,
+such as the form title or a logo. Template page i is used for the i-th page image sent
+for extraction.
+"""
+import os
+import io
+import json
+import hashlib
+import threading
+from dataclasses import dataclass
+import numpy as np
+from PIL import Image, ImageOps
+from numpy.lib.stride_tricks import sliding_window_view
+from dotenv import load_dotenv
+from pipeline import run_concurrently
+from extraction_cache import get_or_extract
+from extractors import ImageDataURL
+
+# Load environment variables from .env file
+load_dotenv()
+
+LAYOUT_TEMPLATE_DIR = os.getenv("LAYOUT_TEMPLATE_DIR", "layouts")
+# Re-query null or invalid fields on their template regions when a template exists
+REGION_REFINEMENT = os.getenv("REGION_REFINEMENT", "true").lower() in ("1", "true", "yes")
+# Field crops sent together in one request
+REGION_CROPS_PER_REQUEST = int(os.getenv("REGION_CROPS_PER_REQUEST", "8"))
+# Extra margin around each region, as a fraction of the page content width/height
+REGION_PADDING = float(os.getenv("REGION_PADDING", "0.01"))
+# Largest page rotation corrected by deskewing
+MAX_DESKEW_DEGREES = float(os.getenv("MAX_DESKEW_DEGREES", "5"))
+# Pages whose content box aspect ratio differs more than this from the template are not cropped
+ASPECT_TOLERANCE = 0.08
+# Minimum normalized cross-correlation for an anchor to count as found
+MIN_ANCHOR_SCORE = 0.5
+# Side of the downscaled image used for deskewing and alignment
+ALIGN_SIDE = 1000
+# How far (in ALIGN_SIDE pixels) an anchor is searched for around its expected position
+ANCHOR_SEARCH = 24
+# Gray level below which a pixel counts as ink, and the ink fraction a content row/column needs
+INK_LEVEL = 128
+CONTENT_MIN_INK = 0.002
+
+REGION_PROMPT = '''<task>
+Each image is a crop of ONE field of a "{title}". In order, the crops show these fields:
+{field_list}
+Read the handwritten or printed value in each crop and return a JSON object with these exact keys.
+If a crop is empty or unreadable, set its value to null.
+</task>
+MANDATORY: Your response MUST be a valid JSON object only - no additional text.'''
+
+@dataclass(frozen=True)
+class TemplatePage:
+    """
+    One page of a layout template. Regions and anchors are (x0, y0, x1, y1) boxes
+    normalized to the reference page's content box; anchor_patches are the matching
+    grayscale pixels of the reference at ALIGN_SIDE scale.
+    """
+    aspect: float
+    regions: dict
+    anchors: tuple = ()
+    anchor_patches: tuple = ()
+
+@dataclass(frozen=True)
+class LayoutTemplate:
+    form_type: str
+    pages: tuple
+
+LAYOUT_TEMPLATES = {}
+_templates_lock = threading.Lock()
+
+def register_layout_template(template):
+    with _templates_lock:
+        LAYOUT_TEMPLATES[template.form_type] = template
+    return template
+
+def get_layout_template(form_type):
+    """
+    Return the registered layout template of a form type, loading
+    LAYOUT_TEMPLATE_DIR/<form_type>.json on first use; None if there is none.
+    """
+    with _templates_lock:
+        if form_type in LAYOUT_TEMPLATES:
+            return LAYOUT_TEMPLATES[form_type]
+    path = os.path.join(LAYOUT_TEMPLATE_DIR, f"{form_type}.json")
+    template = load_layout_template(form_type, path) if os.path.exists(path) else None
+    with _templates_lock:
+        return LAYOUT_TEMPLATES.setdefault(form_type, template)
+
+# Number of leading pages refine_with_regions needs to keep (0 when there is no template)
+def layout_page_count(form_type):
+    template = get_layout_template(form_type) if REGION_REFINEMENT else None
+    return len(template.pages) if template else 0
+
+# Downscale to ALIGN_SIDE and convert to grayscale
+def _align_image(img):
+    img = ImageOps.grayscale(img)
+    scale = ALIGN_SIDE / max(img.size)
+    if scale < 1:
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.BILINEAR)
+    return img
+
+def content_box(gray):
+    """
+    Return the (x0, y0, x1, y1) pixel box around the printed content of a grayscale
+    image, or None for a blank image.
+    """
+    ink = np.asarray(gray) < INK_LEVEL
+    rows = np.flatnonzero(ink.mean(axis=1) > CONTENT_MIN_INK)
+    cols = np.flatnonzero(ink.mean(axis=0) > CONTENT_MIN_INK)
+    if not len(rows) or not len(cols):
+        return None
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def estimate_skew(gray, max_degrees=None):
+    """
+    Return the rotation (degrees, counter-clockwise) that makes the text rows of a
+    grayscale page horizontal: the angle whose row ink profile is the sharpest.
+    """
+    max_degrees = MAX_DESKEW_DEGREES if max_degrees is None else max_degrees
+    ink = gray.point(lambda value: 255 if value < INK_LEVEL else 0)
+    def sharpness(angle):
+        rows = np.asarray(ink.rotate(angle, resample=Image.NEAREST), dtype=np.float32).sum(axis=1)
+        return float(np.sum(np.diff(rows) ** 2))
+    # Coarse search in 1 degree steps, then refine to 0.1 degree around the best angle
+    best = max(np.arange(-max_degrees, max_degrees + 0.01, 1.0), key=sharpness)
+    best = max(np.arange(best - 0.9, best + 0.91, 0.1), key=sharpness)
+    return round(float(best), 1)
+
+# Map a normalized box onto a pixel content box
+def _to_pixels(box, content, dx=0.0, dy=0.0):
+    x0, y0, x1, y1 = content
+    width, height = x1 - x0, y1 - y0
+    return (x0 + box[0] * width + dx, y0 + box[1] * height + dy, x0 + box[2] * width + dx, y0 + box[3] * height + dy)
+
+# Best normalized cross-correlation of a patch around (x, y); returns (score, dx, dy)
+def _match_anchor(page, patch, x, y, search=ANCHOR_SEARCH):
+    height, width = patch.shape
+    left, top = max(0, int(x) - search), max(0, int(y) - search)
+    window = page[top:int(y) + height + search, left:int(x) + width + search]
+    if window.shape[0] < height or window.shape[1] < width:
+        return 0.0, 0, 0
+    views = sliding_window_view(window, patch.shape)
+    views = views - views.mean(axis=(2, 3), keepdims=True)
+    centered = patch - patch.mean()
+    norms = np.sqrt((views ** 2).sum(axis=(2, 3))) * (np.linalg.norm(centered) or 1.0)
+    scores = np.einsum("ijkl,kl->ij", views, centered) / np.where(norms == 0, 1.0, norms)
+    row, col = np.unravel_index(int(np.argmax(scores)), scores.shape)
+    return float(scores[row, col]), left + col - x, top + row - y
+
+def align_page(image_bytes, template_page):
+    """
+    Deskew a page image and locate the template on it. Returns (deskewed image,
+    function mapping a normalized template box to a pixel box of that image), or
+    None when the page does not fit the template.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    small = _align_image(img)
+    angle = estimate_skew(small)
+    if angle:
+        img = img.rotate(angle, resample=Image.BICUBIC, expand=False, fillcolor="white")
+        small = small.rotate(angle, resample=Image.BICUBIC, expand=False, fillcolor=255)
+    content = content_box(small)
+    if content is None:
+        return None
+    aspect = (content[2] - content[0]) / max(1, content[3] - content[1])
+    if abs(aspect / template_page.aspect - 1) > ASPECT_TOLERANCE:
+        return None
+    # Anchors refine the content box alignment by their median offset
+    page = np.asarray(small, dtype=np.float32)
+    offsets = []
+    for anchor, patch in zip(template_page.anchors, template_page.anchor_patches):
+        x0, y0, _, _ = _to_pixels(anchor, content)
+        score, dx, dy = _match_anchor(page, patch, x0, y0)
+        if score >= MIN_ANCHOR_SCORE:
+            offsets.append((dx, dy))
+    if template_page.anchors and not offsets:
+        return None
+    dx = float(np.median([o[0] for o in offsets])) if offsets else 0.0
+    dy = float(np.median([o[1] for o in offsets])) if offsets else 0.0
+    scale = img.width / small.width
+    def to_pixels(box):
+        return tuple(round(v * scale) for v in _to_pixels(box, content, dx, dy))
+    return img, to_pixels
+
+def load_layout_template(form_type, path):
+    """
+    Read a layout template JSON file (see the module docstring), converting its pixel
+    boxes to boxes normalized to the content box of each reference image.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    pages = []
+    for page_spec in spec["pages"]:
+        with Image.open(os.path.join(os.path.dirname(path), page_spec["reference_image"])) as reference:
+            reference = ImageOps.grayscale(reference)
+        small = _align_image(reference)
+        scale = small.width / reference.width
+        content = content_box(small)
+        x0, y0, x1, y1 = content
+        def normalize(box):
+            return ((box[0] * scale - x0) / (x1 - x0), (box[1] * scale - y0) / (y1 - y0),
+                    (box[2] * scale - x0) / (x1 - x0), (box[3] * scale - y0) / (y1 - y0))
+        anchors = tuple(normalize(box) for box in page_spec.get("anchors", ()))
+        pixels = np.asarray(small, dtype=np.float32)
+        patches = tuple(
+            pixels[round(box[1] * scale):round(box[3] * scale), round(box[0] * scale):round(box[2] * scale)]
+            for box in page_spec.get("anchors", ())
+        )
+        pages.append(TemplatePage(
+            aspect=(x1 - x0) / (y1 - y0),
+            regions={name: normalize(box) for name, box in page_spec["regions"].items()},
+            anchors=anchors,
+            anchor_patches=patches,
+        ))
+    return LayoutTemplate(form_type, tuple(pages))
+
+# Crop a region (with padding) out of an aligned page and encode it as JPEG
+def _crop_region(img, to_pixels, box):
+    padded = (box[0] - REGION_PADDING, box[1] - REGION_PADDING, box[2] + REGION_PADDING, box[3] + REGION_PADDING)
+    x0, y0, x1, y1 = to_pixels(padded)
+    crop = img.crop((max(0, x0), max(0, y0), min(img.width, x1), min(img.height, y1)))
+    buffer = io.BytesIO()
+    crop.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+# Ask the model for the values of several field crops in one request
+def _query_crops(extractor, title, crops, deadline):
+    prompt = REGION_PROMPT.replace("{title}", title).replace(
+        "{field_list}", "\n".join(f'{i}. "{name}"' for i, (name, _) in enumerate(crops, 1))
+    )
+    content = [{"type": "text", "text": prompt}]
+    for _, crop in crops:
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": ImageDataURL(crop, "image/jpeg")}
+        })
+    cache_key = b"".join(hashlib.sha256(crop).digest() for _, crop in crops)
+    result = get_or_extract(
+        cache_key,
+        prompt,
+        extractor.model,
+        lambda: extractor.extract_messages([{"role": "user", "content": content}], deadline),
+    )
+    try:
+        values = json.loads(result)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    return values if isinstance(values, dict) else {}
+
+def refine_with_regions(extractor, schema, pages, combined_json, deadline=None):
+    """
+    Re-read the fields that the full-page pass left empty or that fail validation
+    from crops of their template regions. pages are the preprocessed
+    (image bytes, mime type, stats) tuples in the order they were extracted.
+    Returns (updated combined_json, names of the fields that were filled or corrected).
+    """
+    template = get_layout_template(schema.form_type) if REGION_REFINEMENT else None
+    if template is None or not pages:
+        return combined_json, []
+    autofill = schema.matcher.match(combined_json)
+    errors = schema.validate(autofill)
+    targets = [name for name in schema.field_names if autofill.get(name) in (None, "") or name in errors]
+    if not targets:
+        return combined_json, []
+    batches = []
+    for template_page, page in zip(template.pages, pages):
+        wanted = [name for name in targets if name in template_page.regions]
+        if not wanted:
+            continue
+        try:
+            aligned = align_page(page[0], template_page)
+        except Exception:
+            aligned = None
+        if aligned is None:
+            continue
+        img, to_pixels = aligned
+        crops = [(name, _crop_region(img, to_pixels, template_page.regions[name])) for name in wanted]
+        for start in range(0, len(crops), REGION_CROPS_PER_REQUEST):
+            batches.append(crops[start:start + REGION_CROPS_PER_REQUEST])
+    replies = run_concurrently(batches, lambda crops: _query_crops(extractor, schema.title, crops, deadline))
+    fields_by_name = {f.name: f for f in schema.fields}
+    corrections = {}
+    for reply in replies:
+        for name, value in reply.items():
+            if name not in fields_by_name or name in corrections or value in (None, ""):
+                continue
+            # Invalid values are only replaced by values that pass validation
+            if name in errors and fields_by_name[name].validate(value):
+                continue
+            corrections[name] = value
+    # The extracted keys that autofilled a corrected field are dropped, and the corrections go
+    # first under their schema names, so the matcher picks them over any other spelling
+    replaced_keys = {key for name, key in schema.matcher.match_keys(combined_json).items() if name in corrections}
+    updated = dict(corrections)
+    for key, value in combined_json.items():
+        if key not in replaced_keys and key not in corrections:
+            updated[key] = value
+    return updated, list(corrections)
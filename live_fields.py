@@ -0,0 +1,19 @@
+import streamlit as st
+from jobs import QUEUED
+
+def show_job_progress(job, title="Fields received so far"):
+    """
+    Show an extraction job that is still queued or running: a per-page progress bar
+    and every field its worker has reported so far. Workers cannot draw on the page,
+    so they only record progress on the job and the script reruns to render it.
+    """
+    if job["status"] == QUEUED:
+        st.info(":hourglass_flowing_sand: Waiting for a free extraction worker...")
+        return
+    total_pages = job["total_pages"]
+    done_pages = min(job["done_pages"], total_pages)
+    st.progress(done_pages / total_pages if total_pages else 0.0, text=f"Extracted {done_pages} of {total_pages} page(s)...")
+    arrived = {key: value for key, value in job["fields"].items() if value is not None and value != ""}
+    if arrived:
+        st.caption(f"{title} ({len(arrived)})")
+        st.json(arrived, expanded=False)
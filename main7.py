@@ -1,366 +1,331 @@
 import streamlit as st
-import base64
 import os
 from dotenv import load_dotenv
-import fitz  # PyMuPDF for PDF
-import docx2txt  # For extracting images from DOCX
-import tempfile
 import json
 from difflib import SequenceMatcher
 from PIL import Image
 import io
-import requests
-from pymongo import MongoClient
+import hashlib
+import time
+import threading
+from documents import extract_images_from_pdf, extract_images_from_docx
+from text_layer import extract_pdf_text_layer, pages_needing_vision
+from pipeline import extract_in_groups, merge_extraction_results
+from preprocess import preprocess_image
+from extraction_cache import get_or_extract, get_cache_stats
+from form_schema import get_form_schema
+from scheduler import document_deadline
+from extractors import build_extractor, emit_fields, is_valid_result, record_model_calls, BATCH_PROMPT_SUFFIX
+from live_fields import show_job_progress
+from jobs import get_job_store, JobWorkerPool, JOB_POLL_SECONDS, QUEUED, RUNNING, DONE, FAILED
+from page_classifier import pdf_pages_to_send, classify_page, SKIP
+from layout_template import refine_with_regions, layout_page_count
+from image_dedup import Deduplicator, dedupe_images
+from submissions import create_indexes_at_startup, get_submission_writer, get_extraction_run_writer, build_submission, build_extraction_run
 # Load environment variables from .env file
 load_dotenv()
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-MONGODB_ATLAS_URI = os.getenv("MONGODB_ATLAS_URI")
+# Vision model backend; EXTRACTION_PROVIDER / HEDGE_PROVIDER (groq, openrouter, stub) override the default
+@st.cache_resource
+def get_extractor():
+    return build_extractor(os.getenv("EXTRACTION_PROVIDER", "openrouter"), os.getenv("HEDGE_PROVIDER"))
+EXTRACTOR = get_extractor()
 
-# Helper to convert image bytes to base64
-def encode_image_to_base64(image_bytes):
-    return base64.b64encode(image_bytes).decode("utf-8")
-# Extract images from PDF
-def extract_images_from_pdf(pdf_bytes):
-    images = []
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        for page in doc:
-            for img in page.get_images(full=True):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                images.append(image_bytes)
-    return images
+# Form definition: the prompt, the autofill matcher and the form fields are all generated from it
+FORM_SCHEMA = get_form_schema("merchant_application")
+REQUIRED_KEYS = FORM_SCHEMA.field_names
+FIELD_MATCHER = FORM_SCHEMA.matcher
 
-# Extract images from DOCX
-def extract_images_from_docx(docx_path):
-    images = []
-    temp_dir = tempfile.mkdtemp()
-    docx2txt.process(docx_path, temp_dir)
-    for fname in os.listdir(temp_dir):
-        if fname.lower().endswith(('.jpg', '.jpeg', '.png')):
-            with open(os.path.join(temp_dir, fname), 'rb') as f:
-                images.append(f.read())
-    return images
+EXTRACTION_MODEL = EXTRACTOR.model
+EXTRACTION_PROMPT = FORM_SCHEMA.prompt
 
-# Send base64 image to  API for JSON extraction
-def extract_text_from_image(base64_image):
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "meta-llama/llama-4-scout",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": '''<role>You are an expert OCR and form data extraction specialist.</role>
-<task>
-From this image, determine if it belongs to a **Merchant Application Form**. 
-Only if it is a valid Merchant Application Form, extract **all visible information** from it and return it as a valid JSON object with key-value pairs. 
+# Job queue of this app; `python jobs.py --app main7` runs extra workers for it
+JOB_QUEUE = "main7"
+# Per-page results kept in the session for the latest extractions; every request is stored with its extraction run
+SESSION_PAGE_RESULTS = int(os.getenv("SESSION_PAGE_RESULTS", "20"))
 
-If the image does **not** contain a Merchant Application Form, return exactly this JSON:
-{"form_type": "not_merchant_form"}
-</task>
+# Send image bytes to the vision model for JSON extraction
+# (streamed: on_field(key, value) is called as fields arrive, stopping early once all required keys are filled)
+def extract_text_from_image(image_bytes, mime_type="image/jpeg", deadline=None, on_field=None):
+    return EXTRACTOR.stream(image_bytes, EXTRACTION_PROMPT, mime_type, deadline, on_field, REQUIRED_KEYS)
 
-<form_identification>
-To identify a valid Merchant Application Form, look for keywords such as:
-- "Merchant Application Form"
-- "Merchant Name", "Business Address", "Account", "NIC", "Legal Structure", etc.
-- Typical form layout with labeled fields and handwritten or typed responses
-If these are not present, treat it as an irrelevant form or image.
-</form_identification>
+# Send preprocessed image bytes for extraction, reusing the cached result for an identical page
+def extract_page(image_bytes, mime_type, deadline=None, on_field=None):
+    result = get_or_extract(
+        image_bytes,
+        EXTRACTION_PROMPT,
+        EXTRACTION_MODEL,
+        lambda: extract_text_from_image(image_bytes, mime_type, deadline, on_field),
+    )
+    # Cache hits never streamed, so report their fields now (repeats are ignored by the UI)
+    emit_fields(result, on_field)
+    return result
 
-<instructions>
-1. ONLY return data if the image contains a merchant application form
-2. If it's a merchant application form, extract every visible field from it
-3. Your response MUST be a valid JSON object only — no markdown, no text before or after
-4. Use these **exact key names** when matching fields:
-- "Date"
-- "MID"
-- "TID"
-- "New Outlet"
-- "Chain Outlet"
-- "Merchant Name Commercial"
-- "Merchant Name legal"
-- "Established Since"
-- "Business Address Commercial"
-- "City"
-- "Telephone / Cell"
-- "Email/Web"
-- "Contact Person Name"
-- "Business Address Legal"
-- "Number of Outlets"
-- "Location of Branches"
-- "Type of Business/Type of Merchandise/Service Sold"
-- "Annual Sales Volume"
-- "Average Transaction size"
-- "Expected Volume"
-- "Legal Structure"
-- "First Name"
-- "Last Name"
-- "NIC (Old)"
-- "NIC New"
-- "Residence Address"
-- "Authorized Signatory First Name"
-- "Authorized Signatory Last Name"
-- "Authorized Signatory NIC(Old)"
-- "Authorized Signatory NIC(New)"
-- "Payment Mode"
-- "Banker Name & Branch"
-- "Account/IBAN"
-- "Merchant Cheaque Beneficiary Name"
-- "Merchant Cheaque Beneficiary Address"
-- "Do You want Direct Credit Facility with UBL"
-- "If any previous Credit Card acceptance relationship"
-- "If yes, with"
-- "Current Status of Relationship"
-- "If active, what equipment is already in place"
-- "If Terminated Reason of Termination"
-- "Discount Rates Offered"
-If a field is missing or unreadable, return its value as `null`.
-</instructions>
+# Send several preprocessed pages in one request and get back one merged JSON object
+def extract_page_group(pages, deadline=None, on_field=None):
+    # Cache key covers every page of the group, in order
+    group_key = b"".join(hashlib.sha256(image_bytes).digest() for image_bytes, _, _ in pages)
+    result = get_or_extract(
+        group_key,
+        EXTRACTION_PROMPT + BATCH_PROMPT_SUFFIX,
+        EXTRACTION_MODEL,
+        lambda: EXTRACTOR.extract_batch(
+            [(image_bytes, mime_type) for image_bytes, mime_type, _ in pages],
+            EXTRACTION_PROMPT,
+            deadline,
+        ),
+    )
+    if is_usable_group_result(result):
+        emit_fields(result, on_field)
+    return result
+
+# A merged reply is only trusted if it is valid JSON and fills at least one form field
+def is_usable_group_result(result):
+    if not is_valid_result(result):
+        return False
+    return any(value is not None for value in FIELD_MATCHER.match(json.loads(result)).values())
 
-<formatting>
-- NEVER use markdown or backticks
-- ALWAYS return a plain JSON object
-- ALWAYS ensure valid JSON syntax with double quotes
-- NEVER hallucinate or assume field values
-- ALWAYS use `null` if uncertain
-</formatting>
-<examples>
-Good response: {"Date": "2025-07-09", "Merchant Name Commercial": "ABC Store", "Telephone": "1234567890", "Business Address Commercial": "123 Main St", "City": "Karachi", "Anual Sales Volume": "100000", "Average Transaction size": "5000"}
-Bad response: json {"Date": "2025-07-09"} or "Here is the extracted data: {..."
-</examples>
-'''
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "temperature": 0,
-        "max_tokens": 1024
-    }
-    try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        content = result["choices"][0]["message"]["content"].strip()
-        if '{' in content:
-            content = content[content.find('{'):]
-        if '}' in content:
-            content = content[:content.rfind('}') + 1]
-        json.loads(content)
-        return content
-    except Exception as e:
-        return '{"error": "Could not extract valid JSON from image or API error."}'
 def match_and_autofill_fields(extracted_json):
     """
     Given the extracted JSON, return a dict with the required keys auto-populated if possible.
-    Matching is case-insensitive and ignores minor variations.
+    Matching is case-insensitive, ignores punctuation and tolerates minor spelling variations;
+    each required key gets its best-scoring extracted key.
     """
-    required_keys = [
-        "Date",
-        "MID",
-        "TID",
-        "New Outlet",
-        "Chain Outlet",
-        "Merchant Name Commercial",
-        "Merchant Name legal",
-        "Established Since",
-        "Business Address Commercial",
-        "City",
-        "Telephone / Cell",
-        "Email/Web",
-        "Contact Person Name",
-        "Business Address Legal",
-        "Number of Outlets",
-        "Location of Branches",
-        "Type of Business/Type of Merchandise/Service Sold",
-        "Annual Sales Volume",
-        "Average Transaction size",
-        "Expected Volume",
-        "Legal Structure",
-        "First Name",
-        "Last Name",
-        "NIC (Old)",
-        "NIC New",
-        "Residence Address"
-        "Authorized Signatory First Name",
-        "Authorized Signatory Last Name",
-        "Authorized Signatory NIC(Old)",
-        "Authorized Signatory NIC(New)",
-        "Payment Mode",
-        "Banker Name & Branch",
-        "Account/IBAN",
-        "Merchant Cheaque Beneficiary Name",
-        "Merchant Cheaque Beneficiary Address",
-        "Do You want Direct Credit Facility with UBL",
-        "If any previous Credit Card acceptance relationship",
-        "If yes, with",
-        "Current Status of Relationship",
-        "If active, what equipment is already in place",
-        "If Terminated Reason of Termination",
-        "Discount Rates Offered"
-    ]
-    autofill = {k: None for k in required_keys}
-    if not extracted_json:
-        return autofill
-    for req_key in required_keys:
-        for k, v in extracted_json.items():
-            # Simple normalization for matching
-            if req_key.lower().replace(" ", "").replace("(", "").replace(")", "").replace("+", "") in k.lower().replace(" ", "").replace("(", "").replace(")", "").replace("+", ""):
-                autofill[req_key] = v
-                break
-    return autofill
+    return FIELD_MATCHER.match(extracted_json)
 
-def get_mongo_collection():
+# Decode an upload into (page images, text-layer fields, number of skipped text pages)
+def load_document(file_name, file_type, file_bytes):
+    if file_type.startswith("image/"):
+        return [file_bytes], {}, 0
+    if file_name.endswith(".pdf"):
+        # Digital PDFs: read AcroForm/text-layer fields first and only rasterize what is still needed
+        text_fields, text_pages, page_count = extract_pdf_text_layer(file_bytes, REQUIRED_KEYS)
+        pages = pages_needing_vision(text_fields, text_pages, page_count, REQUIRED_KEYS)
+        # Cover letters and other text pages without form labels are never rendered
+        pages, skipped_pages = pdf_pages_to_send(file_bytes, FORM_SCHEMA, pages)
+        images = extract_images_from_pdf(file_bytes, pages=pages) if pages else []
+        return images, text_fields, skipped_pages
+    if file_name.endswith(".docx"):
+        return extract_images_from_docx(file_bytes), {}, 0
+    return None, {}, 0
+
+# Preprocess, extract and merge all page images; on_pages(count) is called as pages are finished.
+# Also returns a log of every extraction request: its pages, raw reply and model calls
+def extract_document(images, text_fields, on_field=None, on_pages=None):
+    deadline = document_deadline(len(images))
+    deduplicator = Deduplicator()
+    # DOCX and image uploads are in memory, so each group of duplicates is collapsed up front to
+    # its highest-resolution copy; lazily rendered PDF pages are checked one by one as they stream
+    distinct_indexes = set(dedupe_images(images)) if isinstance(images, list) else None
+    # Requests are logged with the PDF page numbers, not positions among the pages sent
+    page_numbers = getattr(images, "page_numbers", None) or range(1, len(images) + 1)
+    report = {"bytes_saved": 0, "duplicate_pages": 0, "skipped_pages": 0, "refined_fields": []}
+    # Only the first pages are kept around for the layout template pass
+    region_pages = []
+    region_page_count = layout_page_count(FORM_SCHEMA.form_type)
+    requests_log = []
+    def pages_done(count=1):
+        if on_pages is not None:
+            on_pages(count)
+    def log_request(pages, result, calls):
+        requests_log.append({
+            "pages": [page[2]["page_number"] for page in pages],
+            "result": result,
+            # Cache hits make no model call
+            "cached": not calls,
+            "calls": calls,
+        })
+    # Decode, deduplicate, downscale/recompress and classify one page at a time as the extraction
+    # workers take them, so the first request goes out after page 1 and memory stays flat
+    def prepared_pages():
+        for index, image_bytes in enumerate(images):
+            page_number = page_numbers[index]
+            # Exact and near-duplicate scans are only sent once
+            if distinct_indexes is not None:
+                duplicate = index not in distinct_indexes
+            else:
+                duplicate = deduplicator.is_duplicate(image_bytes)
+            if duplicate:
+                report["duplicate_pages"] += 1
+                pages_done()
+                continue
+            page = preprocess_image(image_bytes)
+            page[2]["page_number"] = page_number
+            report["bytes_saved"] += page[2]["bytes_saved"]
+            # Blank pages and ID card copies are dropped before the expensive extraction call
+            with record_model_calls() as calls:
+                verdict = classify_page(page, FORM_SCHEMA.title, deadline)
+            # Only PAGE_CLASSIFIER=model asks the vision model; its calls are costed like the rest
+            if calls:
+                requests_log.append({"pages": [page_number], "classification": verdict, "calls": calls})
+            if verdict == SKIP:
+                report["skipped_pages"] += 1
+                pages_done()
+                continue
+            if len(region_pages) < region_page_count:
+                region_pages.append(page)
+            yield page
+    def extract_single(page):
+        with record_model_calls() as calls:
+            result = extract_page(page[0], page[1], deadline, on_field)
+        log_request([page], result, calls)
+        pages_done()
+        return result
+    # Pages of an unusable group are counted when they are retried one by one
+    def extract_group(group):
+        with record_model_calls() as calls:
+            result = extract_page_group(group, deadline, on_field)
+        log_request(group, result, calls)
+        if is_usable_group_result(result):
+            pages_done(len(group))
+        return result
+    # Pages go out PAGE_BATCH_SIZE at a time through a bounded queue; groups whose merged reply
+    # is unusable are retried page by page. Results are combined in page order (only update null values)
+    results = extract_in_groups(prepared_pages(), extract_single, extract_group, is_usable_group_result)
+    # Text-layer fields come first so they win over the vision model
+    if text_fields:
+        results = [json.dumps(text_fields)] + results
+    combined_json, page_results = merge_extraction_results(results)
+    # Re-read fields left empty or invalid from crops of their regions on the form's layout template
+    with record_model_calls() as calls:
+        combined_json, report["refined_fields"] = refine_with_regions(EXTRACTOR, FORM_SCHEMA, region_pages, combined_json, deadline)
+    if calls:
+        requests_log.append({"pages": [page[2]["page_number"] for page in region_pages], "refined_fields": report["refined_fields"], "calls": calls})
+    emit_fields(json.dumps({name: combined_json[name] for name in report["refined_fields"]}), on_field)
+    requests_log.sort(key=lambda request: request["pages"][:1])
+    return combined_json, page_results, report, requests_log
+
+def process_job(job, progress):
     """
-    Get MongoDB collection using Atlas connection with fallback to local.
-    Returns None if connection fails.
+    Given a claimed upload job, run the whole extraction pipeline on it and return a
+    JSON-serializable result. Runs on a job worker thread (or a `python jobs.py` worker),
+    so it reports through progress(done pages, total pages, fields so far) and never
+    touches the Streamlit page. Raises ValueError for uploads with nothing to extract.
     """
-    try:
-        # Try MongoDB Atlas first
-        if MONGODB_ATLAS_URI and MONGODB_ATLAS_URI != "mongodb+srv://<username>:<password>@<cluster-url>/<database>?retryWrites=true&w=majority":
-            client = MongoClient(MONGODB_ATLAS_URI, serverSelectionTimeoutMS=5000)
-            # Test the connection
-            client.admin.command('ping')
-            db = client["formextract_db"]
-            collection = db["submitted_forms"]
-            return collection
-        else:
-            # Fallback to local MongoDB
-            st.warning("MongoDB Atlas URI not configured. Using local MongoDB connection.")
-            client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=5000)
-            # Test the connection
-            client.admin.command('ping')
-            db = client["formextract_db"]
-            collection = db["submitted_forms"]
-            return collection
-    except Exception as e:
-        st.error(f"Failed to connect to MongoDB: {str(e)}")
-        return None
+    images, text_fields, skipped_text_pages = load_document(job["file_name"], job["file_type"], job["file_bytes"])
+    if images is None:
+        raise ValueError("Unsupported file type.")
+    if not images and not text_fields:
+        if skipped_text_pages:
+            raise ValueError(f"No pages of the uploaded file look like a {FORM_SCHEMA.title}.")
+        raise ValueError("No images found in the uploaded file.")
+    total_pages = len(images)
+    fields = {key: value for key, value in text_fields.items() if value not in (None, "")}
+    done = [0]
+    lock = threading.Lock()
+    progress(0, total_pages, fields)
+    def on_field(key, value):
+        if value is not None and value != "":
+            with lock:
+                fields.setdefault(key, value)
+    def on_pages(count):
+        with lock:
+            done[0] += count
+            progress(done[0], total_pages, fields)
+    combined_json, page_results, report, requests_log = extract_document(images, text_fields, on_field, on_pages)
+    report["skipped_pages"] += skipped_text_pages
+    # Raw replies and provenance go to the extraction_runs collection, not the job result or the session
+    get_extraction_run_writer().submit(build_extraction_run(job["id"], FORM_SCHEMA, job["file_hash"], requests_log))
+    return {
+        "text_fields": len(text_fields),
+        "images": total_pages,
+        "combined_json": combined_json,
+        # Auto-populate the required fields from the combined JSON
+        "autofill": match_and_autofill_fields(combined_json),
+        "page_results": page_results,
+        "failed_pages": sum(1 for page in page_results if "error" in page),
+        "report": report,
+    }
+
+# Queue an upload for extraction, reusing the job of an identical earlier upload unless pages of it failed
+def submit_job(file_name, file_type, file_bytes):
+    store = get_job_store()
+    job = store.find_job(JOB_QUEUE, hashlib.sha256(file_bytes).hexdigest())
+    if job is not None and not (job["status"] == DONE and job["result"]["failed_pages"]):
+        return job["id"]
+    return store.enqueue(JOB_QUEUE, file_name, file_type, file_bytes)
+
+# Extraction workers of this Streamlit process, started once (JOB_WORKERS=0 leaves jobs to `python jobs.py`)
+@st.cache_resource
+def start_job_workers():
+    return JobWorkerPool(get_job_store(), JOB_QUEUE, process_job).start()
+
+# Submission lookup indexes, created once per process in the background so an unreachable
+# MongoDB never holds up the page (the submission writer creates them before its first batch)
+@st.cache_resource
+def start_index_creation():
+    thread = threading.Thread(target=create_indexes_at_startup, name="submission-indexes", daemon=True)
+    thread.start()
+    return thread
 
 def main():
     st.title("FormExtract AI")
     st.markdown("Upload an **image, PDF, or DOCX** file containing handwritten text to extract structured data using AI.")
-    required_keys = [
-        "Date",
-        "MID",
-        "TID",
-        "New Outlet",
-        "Chain Outlet",
-        "Merchant Name Commercial",
-        "Merchant Name legal",
-        "Established Since",
-        "Business Address Commercial",
-        "City",
-        "Telephone / Cell",
-        "Email/Web",
-        "Contact Person Name",
-        "Business Address Legal",
-        "Number of Outlets",
-        "Location of Branches",
-        "Type of Business/Type of Merchandise/Service Sold",
-        "Annual Sales Volume",
-        "Average Transaction size",
-        "Expected Volume",
-        "Legal Structure",
-        "First Name",
-        "Last Name",
-        "NIC (Old)",
-        "NIC New",
-        "Residence Address",
-        "Authorized Signatory First Name",
-        "Authorized Signatory Last Name",
-        "Authorized Signatory NIC(Old)",
-        "Authorized Signatory NIC(New)",
-        "Payment Mode",
-        "Banker Name & Branch",
-        "Account/IBAN",
-        "Merchant Cheaque Beneficiary Name",
-        "Merchant Cheaque Beneficiary Address",
-        "Do You want Direct Credit Facility with UBL",
-        "If any previous Credit Card acceptance relationship",
-        "If yes, with",
-        "Current Status of Relationship",
-        "If active, what equipment is already in place",
-        "If Terminated Reason of Termination",
-        "Discount Rates Offered"
-    ]
+    required_keys = REQUIRED_KEYS
     # Initialize session state for extracted data
     if 'extracted_autofill' not in st.session_state:
         st.session_state.extracted_autofill = {k: "" for k in required_keys}
     if 'extraction_complete' not in st.session_state:
         st.session_state.extraction_complete = False
+    # Background extraction workers for this app's job queue
+    start_job_workers()
+    start_index_creation()
     # --- File upload and extraction logic at the top ---
     st.header(":file_folder: File Upload & Extraction")
     uploaded_file = st.file_uploader("Upload File", type=["jpg", "jpeg", "png", "pdf", "docx"])
+    # The current job survives reruns through session state and browser refreshes through the URL
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
     if uploaded_file is not None:
         st.success(f"File uploaded: {uploaded_file.name}")
         # Add Extract button
         extract_button = st.button("Extract Data", use_container_width=True, type="primary")
         if extract_button:
-            file_type = uploaded_file.type
-            file_bytes = uploaded_file.read()
-            # Determine file type and extract images
-            if file_type.startswith("image/"):
-                images = [file_bytes]
-            elif uploaded_file.name.endswith(".pdf"):
-                images = extract_images_from_pdf(file_bytes)
-            elif uploaded_file.name.endswith(".docx"):
-                temp_path = os.path.join(tempfile.gettempdir(), uploaded_file.name)
-                with open(temp_path, "wb") as f:
-                    f.write(file_bytes)
-                images = extract_images_from_docx(temp_path)
-            else:
-                st.warning("Unsupported file type.")
-                return
-            if not images:
-                st.warning("No images found in the uploaded file.")
-                return
-            st.success(f":white_check_mark: Found {len(images)} image(s). Processing now...")
+            # The upload is queued for the extraction workers; this page only polls the job
+            job_id = submit_job(uploaded_file.name, uploaded_file.type, uploaded_file.read())
+            st.session_state.job_id = job_id
+            st.query_params["job"] = job_id
+        elif job_id is None:
+            st.info("Click 'Extract Data' button above to start processing the uploaded file.")
+    job = get_job_store().get(job_id) if job_id else None
+    job_running = job is not None and job["status"] in (QUEUED, RUNNING)
+    if job_running:
+        # Per-page progress and the fields received so far; the page reruns until the job is finished
+        show_job_progress(job)
+    elif job is not None and job["status"] == FAILED:
+        st.warning(job["error"])
+    elif job is not None:
+        result = job["result"]
+        report = result["report"]
+        if result["text_fields"]:
+            st.success(f":page_facing_up: Read {result['text_fields']} field(s) from the PDF text layer.")
+        if result["images"]:
+            st.success(f":white_check_mark: Processed {result['images']} image(s).")
+        if result["failed_pages"]:
+            st.warning(f"{result['failed_pages']} page(s) could not be extracted after retries; their fields may be missing.")
+        # Fill the form from a finished job once, so later edits are not overwritten on rerun
+        if st.session_state.get("applied_job_id") != job["id"]:
+            st.session_state.applied_job_id = job["id"]
+            st.session_state.extracted_autofill = result["autofill"]
+            st.session_state.extraction_complete = True
             # Initialize session state for all extracted data
             if 'all_extracted_data' not in st.session_state:
                 st.session_state.all_extracted_data = []
-            # Single loading indicator for the entire process
-            with st.spinner(":arrows_counterclockwise: Processing all images and extracting data..."):
-                # Combine all extracted data into one JSON object (only update null values)
-                combined_json = {}
-                for i, img_bytes in enumerate(images):
-                    base64_img = encode_image_to_base64(img_bytes)
-                    result = extract_text_from_image(base64_img)
-                    try:
-                        json_obj = json.loads(result)
-                        st.session_state.all_extracted_data.append(json_obj)
-                        # Only update fields that are null/empty in combined_json
-                        for key, value in json_obj.items():
-                            if key not in combined_json or combined_json[key] is None or combined_json[key] == "":
-                                if value is not None and value != "":
-                                    combined_json[key] = value
-                    except json.JSONDecodeError:
-                        # Skip invalid JSON responses
-                        continue
-            # Auto-populate the required fields from the combined JSON
-            autofill = match_and_autofill_fields(combined_json)
-            st.session_state.extracted_autofill = autofill
-            st.session_state.extraction_complete = True
-            # Show only the final combined result
-            st.markdown("---")
-            st.subheader(":link: Final Extracted Data")
-            st.json(combined_json)
-            st.success(":white_check_mark: Extraction complete! Check the form below.")
-        else:
-            st.info("Click 'Extract Data' button above to start processing the uploaded file.")
+            st.session_state.all_extracted_data = (st.session_state.all_extracted_data + result["page_results"])[-SESSION_PAGE_RESULTS:]
+        # Show only the final combined result
+        st.markdown("---")
+        st.subheader(":link: Final Extracted Data")
+        st.json(result["combined_json"])
+        if report["bytes_saved"] > 0:
+            st.caption(f"Image preprocessing saved {report['bytes_saved'] / 1024:.0f} KB of upload.")
+        if report["duplicate_pages"]:
+            st.caption(f"Skipped {report['duplicate_pages']} duplicate image(s); each would have cost a model call.")
+        if report["skipped_pages"]:
+            st.caption(f"Skipped {report['skipped_pages']} page(s) that do not look like a {FORM_SCHEMA.title}.")
+        if report["refined_fields"]:
+            st.caption(f"Re-read {len(report['refined_fields'])} field(s) from their form regions: {', '.join(report['refined_fields'])}.")
+        cache_stats = get_cache_stats()
+        st.caption(f"Extraction cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es) so far.")
+        st.success(":white_check_mark: Extraction complete! Check the form below.")
     # --- Form section below ---
     st.markdown("---")
     st.header("Form Details")
@@ -372,7 +337,8 @@ def main():
     # The form with auto-filled or empty values
     with st.form("data_form"):
         form_values = {}
-        for key in required_keys:
+        for form_field in FORM_SCHEMA.fields:
+            key = form_field.name
             current_value = st.session_state.extracted_autofill.get(key, "")
             form_values[key] = st.text_input(
                 label=key,
@@ -383,22 +349,28 @@ def main():
         # Submit button
         submitted = st.form_submit_button(":outbox_tray: Submit Form", use_container_width=True)
         if submitted:
-            # Store in MongoDB
-            collection = get_mongo_collection()
-            if collection is not None:
-                try:
-                    insert_result = collection.insert_one(form_values)
-                    st.success("✅ Form submitted successfully and saved to database!")
-                    st.subheader("📋 Submitted Data:")
-                    st.json(form_values)
-                    st.info(f"Form saved with MongoDB ID: {insert_result.inserted_id}")
-                except Exception as e:
-                    st.error(f"Failed to save form to database: {str(e)}")
-                    st.subheader("📋 Form Data (Not Saved):")
-                    st.json(form_values)
-            else:
-                st.error("❌ Database connection failed. Form data not saved.")
+            # Flag values that do not look right; operators can still submit them
+            for field_name, errors in FORM_SCHEMA.validate(form_values).items():
+                st.warning(f"{field_name}: {'; '.join(errors)}")
+            # Saved to the local write-ahead file right away; upserted into MongoDB in the background,
+            # so submitting the same values twice keeps one document
+            writer = get_submission_writer()
+            try:
+                submission_id = writer.submit(build_submission(FORM_SCHEMA, form_values, extraction_job_id=st.session_state.get("applied_job_id")))
+                st.success("✅ Form submitted successfully!")
+                st.subheader("📋 Submitted Data:")
+                st.json(form_values)
+                st.info(f"Submission ID: {submission_id}")
+                stats = writer.get_stats()
+                if stats["pending"] and stats["last_error"]:
+                    st.warning(f"Database unavailable; {stats['pending']} submission(s) will be saved when it is back ({stats['last_error']}).")
+            except OSError as e:
+                st.error(f"Failed to save form: {str(e)}")
                 st.subheader("📋 Form Data (Not Saved):")
                 st.json(form_values)
+    # Refresh while the extraction job is still running
+    if job_running:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 if __name__ == "__main__":
     main()
@@ -0,0 +1,148 @@
+import os
+import io
+import json
+import threading
+import fitz  # PyMuPDF for PDF
+from PIL import Image, ImageFilter
+from dotenv import load_dotenv
+from text_layer import normalize_label, MIN_TEXT_LAYER_CHARS
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "heuristic" skips pages using the text layer and image statistics, "model" also asks
+# CLASSIFIER_MODEL about pages the heuristics cannot decide, "off" sends every page
+PAGE_CLASSIFIER = os.getenv("PAGE_CLASSIFIER", "heuristic").lower()
+CLASSIFIER_PROVIDER = os.getenv("CLASSIFIER_PROVIDER", os.getenv("EXTRACTION_PROVIDER", "groq"))
+CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL")
+# Text-layer pages need this many form labels to count as the form; pages with none are skipped
+MIN_FORM_LABEL_HITS = int(os.getenv("MIN_FORM_LABEL_HITS", "2"))
+# Pages with less than this fraction of dark pixels are treated as blank (a page with a
+# single line of 12pt text has about 0.0009)
+BLANK_PAGE_INK_RATIO = float(os.getenv("BLANK_PAGE_INK_RATIO", "0.0005"))
+# Gray level below which a pixel counts as ink
+INK_LEVEL = 128
+# Width/height range of a landscape ID card copy (ID-1 cards are 85.6 x 54 mm, about 1.59)
+CARD_ASPECT_RANGE = (1.52, 1.65)
+# Longest side of the copy ink is measured on; large enough that printed strokes stay dark
+INK_SIDE = 1024
+
+FORM = "form"
+SKIP = "skip"
+UNKNOWN = "unknown"
+
+CLASSIFICATION_PROMPT = '''Is this image a page of a "{title}" (a printed form with labelled fields)?
+Cover letters, ID card copies, cheques, photos and blank pages are NOT.
+Answer with a JSON object only: {"is_form": true} or {"is_form": false}'''
+
+# Normalized field names and aliases of a form schema, used to spot its labels in page text
+# (labels shorter than 4 characters, like "MID", match inside ordinary words and are left out)
+def form_labels(schema):
+    labels = set()
+    for form_field in schema.fields:
+        for label in (form_field.name,) + tuple(form_field.aliases):
+            norm_label = normalize_label(label)
+            if len(norm_label) >= 4:
+                labels.add(norm_label)
+    return labels
+
+def classify_page_text(text, labels):
+    """
+    Given the text layer of a page, return FORM if it contains at least MIN_FORM_LABEL_HITS
+    form labels, SKIP if it has plenty of text but no labels (cover letters, terms pages)
+    and UNKNOWN for scanned pages or pages with a single label.
+    """
+    norm_text = normalize_label(text)
+    if len(norm_text) < MIN_TEXT_LAYER_CHARS:
+        return UNKNOWN
+    hits = sum(1 for label in labels if label in norm_text)
+    if hits >= MIN_FORM_LABEL_HITS:
+        return FORM
+    return SKIP if hits == 0 else UNKNOWN
+
+def classify_pdf_pages(pdf_bytes, labels, pages=None):
+    """
+    Return {page number: verdict} for the PDF pages (or only the given page numbers)
+    based on their text layer.
+    """
+    verdicts = {}
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            if pages is not None and page.number not in pages:
+                continue
+            verdicts[page.number] = classify_page_text(page.get_text(), labels)
+    return verdicts
+
+def pdf_pages_to_send(pdf_bytes, schema, pages=None):
+    """
+    Drop the PDF pages (all pages if pages is None) whose text layer shows they are not
+    the form, before they are rendered. Returns (kept page numbers, number of skipped pages).
+    """
+    if PAGE_CLASSIFIER == "off" or pages == []:
+        return pages, 0
+    verdicts = classify_pdf_pages(pdf_bytes, form_labels(schema), pages)
+    kept = [p for p in sorted(verdicts) if verdicts[p] != SKIP]
+    return kept, len(verdicts) - len(kept)
+
+def classify_page_image(image_bytes):
+    """
+    Return SKIP for blank pages and landscape ID-card shaped images, UNKNOWN otherwise.
+    Images that cannot be decoded are UNKNOWN so they are still sent.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            width, height = img.size
+            img.draft("L", (INK_SIDE, INK_SIDE))
+            gray = img.convert("L")
+    except Exception:
+        return UNKNOWN
+    # Downscaling averages thin strokes into light grey, so spread every dark pixel over its
+    # neighbours first; a single 12pt glyph stroke then still counts as ink on the smaller copy
+    gray.thumbnail((INK_SIDE * 2, INK_SIDE * 2))
+    gray = gray.filter(ImageFilter.MinFilter(3))
+    gray.thumbnail((INK_SIDE, INK_SIDE))
+    histogram = gray.histogram()
+    ink_ratio = sum(histogram[:INK_LEVEL]) / max(1, sum(histogram))
+    if ink_ratio < BLANK_PAGE_INK_RATIO:
+        return SKIP
+    if height and CARD_ASPECT_RANGE[0] <= width / height <= CARD_ASPECT_RANGE[1]:
+        return SKIP
+    return UNKNOWN
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+# The small model used in "model" mode, created on first use
+def get_classifier_extractor():
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                from extractors import build_extractor
+                _classifier = build_extractor(CLASSIFIER_PROVIDER, model=CLASSIFIER_MODEL)
+    return _classifier
+
+def classify_with_model(image_bytes, mime_type, title, deadline=None):
+    """
+    Ask the classifier model whether the page is the form. Returns FORM or SKIP;
+    any error or unclear reply counts as FORM so the page is still extracted.
+    """
+    prompt = CLASSIFICATION_PROMPT.replace("{title}", title)
+    try:
+        reply = json.loads(get_classifier_extractor().extract(image_bytes, prompt, mime_type, deadline))
+    except Exception:
+        return FORM
+    return SKIP if isinstance(reply, dict) and reply.get("is_form") is False else FORM
+
+def classify_page(page, title, deadline=None):
+    """
+    Given a preprocessed page (image bytes, mime type, stats), return SKIP if it should
+    not be extracted. Pages the heuristics cannot decide are kept (UNKNOWN), or checked
+    with the classifier model in "model" mode.
+    """
+    if PAGE_CLASSIFIER == "off":
+        return UNKNOWN
+    verdict = classify_page_image(page[0])
+    if verdict == UNKNOWN and PAGE_CLASSIFIER == "model":
+        verdict = classify_with_model(page[0], page[1], title, deadline)
+    return verdict
@@ -0,0 +1,156 @@
+import os
+import json
+import queue
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Maximum number of model calls in flight for a single document
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", "4"))
+# Pages sent together in one multi-page request (1 disables batching)
+PAGE_BATCH_SIZE = int(os.getenv("PAGE_BATCH_SIZE", "1"))
+# Upper bound on the base64 image payload of one multi-page request
+PAGE_BATCH_MAX_BYTES = int(os.getenv("PAGE_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+# Decoded items waiting for a free worker in a streaming run; bounds memory for large documents
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", str(2 * MAX_CONCURRENT_EXTRACTIONS)))
+
+ERROR_RESULT = '{"error": "Could not extract valid JSON from image or API error."}'
+
+# Run one extraction call, turning unexpected exceptions into the usual error JSON
+def _safe_extract(extract_fn, item):
+    try:
+        return extract_fn(item)
+    except Exception:
+        return ERROR_RESULT
+
+def run_concurrently(items, fn, max_workers=None):
+    """
+    Run fn over every item with at most max_workers calls in flight and return
+    the results in the same order as items. Exceptions are propagated. Each call runs
+    in a copy of the caller's context, so record_model_calls still sees its model calls.
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(max_workers or MAX_CONCURRENT_EXTRACTIONS, len(items)))
+    if workers == 1:
+        return [fn(item) for item in items]
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda context, item: context.run(fn, item), contexts, items))
+
+def run_streaming(items, fn, max_workers=None, queue_size=None):
+    """
+    Run fn over a (possibly lazy) iterable while it is still being produced. The calling
+    thread pulls items into a bounded queue and max_workers threads process them, so the
+    first call starts as soon as the first item exists and at most queue_size + max_workers
+    items are alive at once. Returns the results in input order; the first exception
+    raised by fn or by the iterable is propagated once the workers have stopped. Workers
+    run in copies of the caller's context, like run_concurrently.
+    """
+    workers = max(1, max_workers or MAX_CONCURRENT_EXTRACTIONS)
+    tasks = queue.Queue(maxsize=max(1, queue_size or PIPELINE_QUEUE_SIZE))
+    results = {}
+    errors = []
+    stop = threading.Event()
+    def consume():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            # After a failure the queue is only drained so the producer never blocks
+            if stop.is_set():
+                continue
+            index, item = task
+            try:
+                results[index] = fn(item)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(contextvars.copy_context().run, consume)
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                tasks.put((count, item))
+                count += 1
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(workers):
+                tasks.put(None)
+    if errors:
+        raise errors[0]
+    return [results[index] for index in range(count)]
+
+def group_pages(pages, max_pages=None, max_bytes=None):
+    """
+    Lazily split preprocessed pages (tuples starting with the image bytes) into consecutive
+    groups of at most max_pages whose base64 payload stays under max_bytes, yielding each
+    group as soon as it is complete. A page larger than max_bytes on its own forms a group by itself.
+    """
+    max_pages = max(1, max_pages or PAGE_BATCH_SIZE)
+    max_bytes = max_bytes or PAGE_BATCH_MAX_BYTES
+    current = []
+    current_bytes = 0
+    for page in pages:
+        page_bytes = 4 * ((len(page[0]) + 2) // 3)
+        if current and (len(current) >= max_pages or current_bytes + page_bytes > max_bytes):
+            yield current
+            current = []
+            current_bytes = 0
+        current.append(page)
+        current_bytes += page_bytes
+    if current:
+        yield current
+
+def extract_in_groups(pages, extract_single, extract_group, is_usable, max_workers=None):
+    """
+    Extract pages in multi-page requests (see group_pages). Each group is sent with
+    extract_group(group); if is_usable(result) rejects the merged reply, its pages
+    are sent one after another with extract_single(page) instead, inside the same worker,
+    so at most max_workers requests are ever in flight. pages may be a lazy
+    iterable: groups are sent while later pages are still being produced (see
+    run_streaming). Returns the raw results in page order: one per accepted group,
+    or one per page for fallback groups.
+    """
+    def run(group):
+        if len(group) > 1:
+            result = _safe_extract(extract_group, group)
+            if is_usable(result):
+                return [result]
+        return [_safe_extract(extract_single, page) for page in group]
+    grouped = run_streaming(group_pages(pages), run, max_workers)
+    return [result for results in grouped for result in results]
+
+def merge_extraction_results(results):
+    """
+    Given the raw JSON strings returned per page (in page order), return
+    (combined_json, parsed_pages). A key keeps the first non-null, non-empty
+    value seen; pages that are not valid JSON objects are skipped.
+    """
+    combined_json = {}
+    parsed_pages = []
+    for result in results:
+        try:
+            json_obj = json.loads(result)
+        except (TypeError, json.JSONDecodeError):
+            # Skip invalid JSON responses
+            continue
+        if not isinstance(json_obj, dict):
+            continue
+        parsed_pages.append(json_obj)
+        # Only update fields that are null/empty in combined_json
+        for key, value in json_obj.items():
+            if key not in combined_json or combined_json[key] is None or combined_json[key] == "":
+                if value is not None and value != "":
+                    combined_json[key] = value
+    return combined_json, parsed_pages
@@ -0,0 +1,84 @@
+import os
+import io
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Longest side (in pixels) an image may have before it is sent to the model
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "2000"))
+# Convert pages to grayscale before sending (form scans rarely need colour)
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+# JPEG quality used when re-encoding
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Guess the MIME type of raw image bytes from their magic number
+def detect_mime_type(image_bytes):
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+# Flatten transparency and exotic modes (P, LA, RGBA, CMYK, 1, I;16...) to RGB or L
+def _normalize_mode(img, grayscale):
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    if grayscale:
+        return img.convert("L")
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+def preprocess_image(image_bytes, max_side=None, grayscale=None, quality=None):
+    """
+    Normalize an extracted image before it is base64 encoded for the model.
+    The image is EXIF-rotated, flattened to RGB (or grayscale), downscaled so its
+    longest side is at most max_side and re-encoded as JPEG at the given quality.
+    Returns (image_bytes, mime_type, stats). If the image cannot be decoded, or the
+    re-encoded version would be larger than an already web-safe original, the
+    original bytes are returned unchanged.
+    """
+    max_side = IMAGE_MAX_SIDE if max_side is None else max_side
+    grayscale = IMAGE_GRAYSCALE if grayscale is None else grayscale
+    quality = IMAGE_JPEG_QUALITY if quality is None else quality
+    original_mime = detect_mime_type(image_bytes)
+    stats = {
+        "original_bytes": len(image_bytes),
+        "processed_bytes": len(image_bytes),
+        "bytes_saved": 0,
+        "original_size": None,
+        "processed_size": None,
+    }
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.load()
+            stats["original_size"] = img.size
+            img = ImageOps.exif_transpose(img)
+            img = _normalize_mode(img, grayscale)
+            resized = max_side and max(img.size) > max_side
+            if resized:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=quality, optimize=True)
+            processed_size = img.size
+    except Exception:
+        # Undecodable formats (e.g. JBIG2 streams) are passed through as-is
+        return image_bytes, original_mime, stats
+    processed = buffer.getvalue()
+    web_safe = original_mime in ("image/jpeg", "image/png")
+    if web_safe and not resized and not grayscale and len(processed) >= len(image_bytes):
+        stats["processed_size"] = stats["original_size"]
+        return image_bytes, original_mime, stats
+    stats["processed_bytes"] = len(processed)
+    stats["bytes_saved"] = len(image_bytes) - len(processed)
+    stats["processed_size"] = processed_size
+    return processed, "image/jpeg", stats
@@ -0,0 +1,192 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Wall-clock budget for all model calls (including retries) of one document, plus
+# PAGE_DEADLINE_SECONDS for every page; time spent queued for a rate-limit token is not charged
+DOCUMENT_DEADLINE_SECONDS = float(os.getenv("DOCUMENT_DEADLINE_SECONDS", "180"))
+PAGE_DEADLINE_SECONDS = float(os.getenv("PAGE_DEADLINE_SECONDS", "20"))
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("MODEL_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("MODEL_BACKOFF_MAX_SECONDS", "30"))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Requests per minute and burst size per provider, overridable as e.g. GROQ_RATE_PER_MINUTE
+DEFAULT_RATE_LIMITS = {
+    "groq": (30, 5),
+    "openrouter": (60, 10),
+}
+
+RETRYABLE_STATUS_CODES = (408, 409, 425, 429, 500, 502, 503, 504)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class CircuitOpenError(Exception):
+    pass
+
+def document_deadline(page_count=0, seconds=None):
+    """
+    Return the monotonic time by which every call for a document of page_count pages
+    must be done, not counting waits for rate-limit tokens.
+    """
+    if seconds is None:
+        seconds = DOCUMENT_DEADLINE_SECONDS + page_count * PAGE_DEADLINE_SECONDS
+    return time.monotonic() + seconds
+
+# Parse a Retry-After header given either as seconds or as an HTTP date
+def _parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(exc):
+    """
+    Return (retryable, retry_after_seconds) for an exception raised by requests or
+    the Groq SDK. HTTP errors are retried on 429/5xx style status codes, honoring
+    Retry-After; connection errors and timeouts are always retried.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status is not None:
+        headers = getattr(response, "headers", None) or {}
+        return status in RETRYABLE_STATUS_CODES, _parse_retry_after(headers.get("retry-after"))
+    name = type(exc).__name__
+    if isinstance(exc, (ConnectionError, TimeoutError)) or "Timeout" in name or "Connection" in name:
+        return True, None
+    return False, None
+
+class TokenBucket:
+    """
+    Classic token bucket: rate_per_minute tokens refill continuously up to burst.
+    pause() stops handing out tokens for a while, used when the provider says 429.
+    acquire() blocks until a token is free and returns the seconds it waited.
+    """
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls until
+    reset_seconds have passed; then lets calls through again (half-open) and
+    closes on the first success.
+    """
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class RequestScheduler:
+    """
+    Runs model calls for one provider through its rate limiter, retries transient
+    failures with exponential backoff and full jitter, and stops early when the
+    document deadline would be missed or the provider's circuit is open. The bucket is
+    shared by every document, so time queued for a token extends the deadline of the call
+    instead of failing pages that never reached the provider.
+    """
+    def __init__(self, name, rate_per_minute, burst, max_retries=None):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    def call(self, fn, deadline=None):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} is failing; requests are paused")
+            waited = self.bucket.acquire()
+            if deadline is not None:
+                deadline += waited
+            try:
+                result = fn()
+            except Exception as exc:
+                retryable, retry_after = classify_error(exc)
+                if not retryable:
+                    raise
+                self.breaker.record_failure()
+                if retry_after is not None:
+                    # Every worker for this provider waits, not just this one
+                    self.bucket.pause(retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_after
+                if delay is None:
+                    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise DeadlineExceeded(f"{self.name} retry would exceed the document deadline") from exc
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(provider):
+    """
+    Return the process-wide scheduler for a provider ("groq", "openrouter", ...).
+    """
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            rate, burst = DEFAULT_RATE_LIMITS.get(provider, (60, 10))
+            prefix = provider.upper()
+            rate = float(os.getenv(f"{prefix}_RATE_PER_MINUTE", str(rate)))
+            burst = int(os.getenv(f"{prefix}_BURST", str(burst)))
+            _schedulers[provider] = RequestScheduler(provider, rate, burst)
+        return _schedulers[provider]
@@ -0,0 +1,451 @@
+"""
+Persistence of submitted forms to MongoDB, off the submit path.
+
+A submit is appended to a local write-ahead file and returns at once; a background
+thread upserts pending submissions with bulk_write, SUBMIT_BATCH_SIZE at a time or
+every SUBMIT_FLUSH_SECONDS, through one pooled MongoClient per process. Submissions
+stay in the write-ahead file until MongoDB has them, so they survive an outage or a
+restart. Each process writes its own file next to SUBMIT_WAL_PATH; a file its process
+stopped refreshing WAL_STALE_SECONDS ago is taken over and replayed by another writer.
+
+Stored documents (schema_version 2) look like:
+
+    {
+        "_id": "<sha256 of form_type and fields>",
+        "schema_version": 2,
+        "form_type": "merchant_application",
+        "fields": {"merchant_name_commercial": "...", "nic_new": "42101-1234567-1", ...},
+        "lookup": {"nic_new": "4210112345671", "mid": "...", "tid": "...", "account": "PK36SCBL..."},
+        "submitted_at": <first submit>, "last_submitted_at": <latest submit>
+    }
+
+Submissions made from an extraction job also carry "extraction_job_id", the _id of
+the job's document in the extraction_runs side collection (build_extraction_run):
+its per-request raw replies, models, prompt version, latencies and token usage.
+
+Field names are the schema's storage keys (FormField.storage_key) and empty fields
+are left out. The content hash makes writes upserts, so submitting the same values
+again (or replaying the write-ahead file) updates last_submitted_at instead of adding
+a document. lookup holds the searched identifiers in canonical form; each is indexed
+together with submitted_at, which find_submissions relies on.
+"""
+import os
+import re
+import json
+import atexit
+import hashlib
+import time
+import socket
+import threading
+from datetime import datetime, timezone
+from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+MONGODB_ATLAS_URI = os.getenv("MONGODB_ATLAS_URI")
+MONGODB_LOCAL_URI = os.getenv("MONGODB_LOCAL_URI", "mongodb://localhost:27017/")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "formextract_db")
+SUBMISSIONS_COLLECTION = os.getenv("SUBMISSIONS_COLLECTION", "submitted_forms")
+EXTRACTION_RUNS_COLLECTION = os.getenv("EXTRACTION_RUNS_COLLECTION", "extraction_runs")
+# Connections the process-wide client may open
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+# Pending submissions are written once this many are waiting, or every SUBMIT_FLUSH_SECONDS
+SUBMIT_BATCH_SIZE = int(os.getenv("SUBMIT_BATCH_SIZE", "100"))
+SUBMIT_FLUSH_SECONDS = float(os.getenv("SUBMIT_FLUSH_SECONDS", "2"))
+# Submissions not yet confirmed by MongoDB, one JSON object per line; each process appends
+# to "<path>.<host>-<pid>" so processes never rewrite each other's pending submissions
+SUBMIT_WAL_PATH = os.getenv("SUBMIT_WAL_PATH", ".submissions.wal")
+EXTRACTION_RUNS_WAL_PATH = os.getenv("EXTRACTION_RUNS_WAL_PATH", ".extraction_runs.wal")
+# A write-ahead file not refreshed for this long belongs to a dead process and is replayed
+WAL_STALE_SECONDS = int(os.getenv("WAL_STALE_SECONDS", "60"))
+
+ATLAS_URI_PLACEHOLDER = "mongodb+srv://<username>:<password>@<cluster-url>/<database>?retryWrites=true&w=majority"
+# MongoDB error code for a document whose _id is already stored (concurrent upserts of one hash)
+DUPLICATE_KEY_ERROR = 11000
+SCHEMA_VERSION = 2
+# Most matches returned by find_submissions
+MAX_LOOKUP_RESULTS = 200
+
+def _digits(value):
+    return re.sub(r"\D", "", value)
+
+# Account numbers and IBANs without spaces or dashes, in upper case
+def _alphanumeric(value):
+    return re.sub(r"[^0-9A-Za-z]", "", value).upper()
+
+# Storage keys kept in canonical form under "lookup", each with an index on (lookup.<key>, submitted_at)
+LOOKUP_NORMALIZERS = {
+    "nic_new": _digits,
+    "mid": _alphanumeric,
+    "tid": _alphanumeric,
+    "account": _alphanumeric,
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_mongo_client():
+    """
+    Return the process-wide MongoClient for MONGODB_ATLAS_URI, or MONGODB_LOCAL_URI when
+    Atlas is not configured. Creating it does not contact the server.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if MONGODB_ATLAS_URI and MONGODB_ATLAS_URI != ATLAS_URI_PLACEHOLDER:
+                    uri = MONGODB_ATLAS_URI
+                else:
+                    uri = MONGODB_LOCAL_URI
+                _client = MongoClient(uri, maxPoolSize=MONGO_MAX_POOL_SIZE, serverSelectionTimeoutMS=5000)
+    return _client
+
+def get_submissions_collection():
+    return get_mongo_client()[MONGODB_DATABASE][SUBMISSIONS_COLLECTION]
+
+def get_extraction_runs_collection():
+    return get_mongo_client()[MONGODB_DATABASE][EXTRACTION_RUNS_COLLECTION]
+
+def ensure_indexes(collection):
+    """
+    Create the lookup and submission date indexes if they do not exist yet
+    (a no-op on the server when they do).
+    """
+    for key in LOOKUP_NORMALIZERS:
+        collection.create_index([(f"lookup.{key}", ASCENDING), ("submitted_at", DESCENDING)], name=f"lookup_{key}_submitted_at")
+    collection.create_index([("submitted_at", DESCENDING)], name="submitted_at")
+    collection.create_index([("extraction_job_id", ASCENDING)], name="extraction_job_id", sparse=True)
+
+# Extraction runs are looked up by submission (their _id), by document and by date for cost reports
+def ensure_run_indexes(collection):
+    collection.create_index([("file_hash", ASCENDING)], name="file_hash")
+    collection.create_index([("form_type", ASCENDING), ("created_at", DESCENDING)], name="form_type_created_at")
+
+def build_submission(schema, form_values, submitted_at=None, extraction_job_id=None):
+    """
+    Given a form schema and the submitted {field name: value}, return the document to
+    store, JSON-serializable so it can go through the write-ahead file.
+    extraction_job_id links it to the extraction run it was filled from.
+    """
+    storage_keys = schema.storage_keys
+    fields = {}
+    for name, value in form_values.items():
+        value = "" if value is None else str(value).strip()
+        if value:
+            fields[storage_keys.get(name) or name] = value
+    lookup = {}
+    for key, normalize in LOOKUP_NORMALIZERS.items():
+        if key in fields and normalize(fields[key]):
+            lookup[key] = normalize(fields[key])
+    content = json.dumps({"form_type": schema.form_type, "fields": fields}, sort_keys=True)
+    document = {
+        "_id": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "schema_version": SCHEMA_VERSION,
+        "form_type": schema.form_type,
+        "fields": fields,
+        "lookup": lookup,
+        "submitted_at": (submitted_at or datetime.now(timezone.utc)).isoformat(),
+    }
+    if extraction_job_id:
+        document["extraction_job_id"] = extraction_job_id
+    return document
+
+# The idempotent write of a submission: insert it once, afterwards only move last_submitted_at forward
+def submission_update(document):
+    document = dict(document)
+    document_id = document.pop("_id")
+    submitted_at = datetime.fromisoformat(document.pop("submitted_at"))
+    document["submitted_at"] = submitted_at
+    return UpdateOne(
+        {"_id": document_id},
+        {"$setOnInsert": document, "$max": {"last_submitted_at": submitted_at}},
+        upsert=True,
+    )
+
+def build_extraction_run(job_id, schema, file_hash, requests, created_at=None):
+    """
+    Given an extraction job and its request log (one {"pages", "result", "cached",
+    "calls"} entry per extraction request or cache hit), return the extraction_runs
+    document with the models used and latency and token totals for cost reporting.
+    """
+    calls = [call for request in requests for call in request["calls"]]
+    totals = {
+        "requests": len(requests),
+        "model_calls": len(calls),
+        "cached_requests": sum(1 for request in requests if request.get("cached")),
+        "latency_seconds": round(sum(call["latency_seconds"] for call in calls), 3),
+    }
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        totals[key] = sum((call["usage"] or {}).get(key) or 0 for call in calls)
+    return {
+        "_id": job_id,
+        "form_type": schema.form_type,
+        "prompt_version": schema.prompt_version,
+        "file_hash": file_hash,
+        "models": sorted({call["model"] for call in calls}),
+        "requests": requests,
+        "totals": totals,
+        "created_at": (created_at or datetime.now(timezone.utc)).isoformat(),
+    }
+
+# Extraction runs are written once; replays of the write-ahead file change nothing
+def extraction_run_insert(document):
+    document = dict(document)
+    document_id = document.pop("_id")
+    document["created_at"] = datetime.fromisoformat(document["created_at"])
+    return UpdateOne({"_id": document_id}, {"$setOnInsert": document}, upsert=True)
+
+def create_indexes_at_startup():
+    """
+    Create the submissions and extraction_runs indexes when an app or the API starts, so
+    find_submissions is served by an index before anything has been written. Returns
+    None, or the error when MongoDB is unreachable; the writers retry before their first batch.
+    """
+    try:
+        ensure_indexes(get_submissions_collection())
+        ensure_run_indexes(get_extraction_runs_collection())
+    except PyMongoError as e:
+        return str(e)
+    return None
+
+def find_submissions(nic_new=None, mid=None, tid=None, account=None, submitted_from=None, submitted_to=None, limit=50, collection=None):
+    """
+    Return the stored submissions matching every given identifier and submission date
+    range (datetimes), newest first. Identifiers are compared in canonical form, so
+    "42101-1234567-1" finds "4210112345671". At least one criterion is required.
+    """
+    query = {}
+    for key, value in (("nic_new", nic_new), ("mid", mid), ("tid", tid), ("account", account)):
+        if value:
+            query[f"lookup.{key}"] = LOOKUP_NORMALIZERS[key](value)
+    date_range = {}
+    if submitted_from:
+        date_range["$gte"] = submitted_from
+    if submitted_to:
+        date_range["$lt"] = submitted_to
+    if date_range:
+        query["submitted_at"] = date_range
+    if not query:
+        raise ValueError("Give at least one of nic_new, mid, tid, account or a submission date range.")
+    collection = collection if collection is not None else get_submissions_collection()
+    cursor = collection.find(query).sort("submitted_at", DESCENDING).limit(max(1, min(limit, MAX_LOOKUP_RESULTS)))
+    return list(cursor)
+
+# Read a write-ahead file; None if another writer took it first
+def _read_wal_file(path):
+    pending = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    pending.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash while it was being appended
+                    continue
+    except FileNotFoundError:
+        return None
+    return pending
+
+class SubmissionWriter:
+    """
+    Buffers submissions (build_submission documents) in this process's write-ahead file
+    and upserts them into a collection in bulk batches from a background thread, creating
+    the collection's indexes before the first batch. operation and create_indexes replace
+    submission_update and ensure_indexes for other kinds of documents. wal_path is the
+    shared base name: the writer keeps its own file beside it and adopts stale ones.
+    """
+    def __init__(self, get_collection=None, wal_path=None, batch_size=None, flush_seconds=None, operation=None, create_indexes=None):
+        self.get_collection = get_collection or get_submissions_collection
+        self.operation = operation or submission_update
+        self.create_indexes = create_indexes or ensure_indexes
+        self.base_path = wal_path or SUBMIT_WAL_PATH
+        self.wal_path = f"{self.base_path}.{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or SUBMIT_BATCH_SIZE
+        self.flush_seconds = SUBMIT_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = threading.Event()
+        self.written = 0
+        self.rejected = 0
+        self.last_error = None
+        self.indexed = False
+        self.pending = _read_wal_file(self.wal_path) or []
+        self.adopt_orphans()
+        self.thread = threading.Thread(target=self._run, name=f"writer-{os.path.basename(self.base_path)}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Write-ahead files of other processes (and the single file older versions shared)
+    def _other_wal_paths(self):
+        directory = os.path.dirname(self.base_path) or "."
+        base_name = os.path.basename(self.base_path)
+        own_name = os.path.basename(self.wal_path)
+        for name in os.listdir(directory):
+            if name != base_name and not name.startswith(base_name + "."):
+                continue
+            if name == own_name or name.startswith(own_name + ".") or name.endswith((".tmp", ".rejected")):
+                continue
+            yield os.path.join(directory, name)
+
+    def adopt_orphans(self):
+        """
+        Take over the write-ahead files of writers that stopped refreshing them
+        WAL_STALE_SECONDS ago and queue their submissions here. A file is claimed by
+        renaming it, so only one live writer replays it.
+        """
+        now = time.time()
+        for path in self._other_wal_paths():
+            try:
+                if os.path.getmtime(path) > now - WAL_STALE_SECONDS:
+                    continue
+                claimed_path = f"{self.wal_path}.adopted-{os.path.basename(path)}"
+                os.rename(path, claimed_path)
+            except OSError:
+                # Gone already: its writer flushed it or another writer claimed it
+                continue
+            documents = _read_wal_file(claimed_path)
+            if documents:
+                with self.lock:
+                    self.pending.extend(documents)
+                    self._rewrite_wal()
+            os.remove(claimed_path)
+
+    # Show other writers this file still has a live owner
+    def _touch_wal(self):
+        try:
+            os.utime(self.wal_path)
+        except FileNotFoundError:
+            pass
+
+    # Rewrite the write-ahead file with the submissions still pending; called with self.lock held
+    def _rewrite_wal(self):
+        if not self.pending:
+            if os.path.exists(self.wal_path):
+                os.remove(self.wal_path)
+            return
+        temp_path = self.wal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for document in self.pending:
+                f.write(json.dumps(document) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.wal_path)
+
+    def submit(self, document):
+        """
+        Record a submission document and return its _id. It is on disk when this
+        returns and reaches MongoDB with the next batch.
+        """
+        line = json.dumps(document) + "\n"
+        with self.lock:
+            with open(self.wal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.append(document)
+            if len(self.pending) >= self.batch_size:
+                self.wake.set()
+        return document["_id"]
+
+    def flush(self):
+        """
+        Write every pending submission now. Returns True if none are left pending;
+        on a database error they stay in the write-ahead file for the next attempt.
+        """
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = self.pending[:self.batch_size]
+                if not batch:
+                    return True
+                try:
+                    collection = self.get_collection()
+                    if not self.indexed:
+                        self.create_indexes(collection)
+                        self.indexed = True
+                    collection.bulk_write([self.operation(document) for document in batch], ordered=False)
+                    rejected = []
+                except BulkWriteError as e:
+                    # Two upserts of the same new hash can race; the document is stored either way
+                    rejected = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY_ERROR]
+                    if rejected:
+                        self.last_error = rejected[0].get("errmsg")
+                except PyMongoError as e:
+                    self.last_error = str(e)
+                    return False
+                # Documents MongoDB refuses outright would block the queue forever; keep them aside
+                if rejected:
+                    with open(self.base_path + ".rejected", "a", encoding="utf-8") as f:
+                        for error in rejected:
+                            f.write(json.dumps(batch[error["index"]]) + "\n")
+                with self.lock:
+                    del self.pending[:len(batch)]
+                    self._rewrite_wal()
+                    self.written += len(batch) - len(rejected)
+                    self.rejected += len(rejected)
+                if not rejected:
+                    self.last_error = None
+
+    def _run(self):
+        while not self.closed.is_set():
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            try:
+                self._touch_wal()
+                self.adopt_orphans()
+                self.flush()
+            except Exception as e:
+                # Keep the writer alive; the submissions are still in the write-ahead file
+                self.last_error = str(e)
+
+    # Stop the background thread after a last flush (also run at interpreter exit)
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+
+    def get_stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        return {"pending": pending, "written": self.written, "rejected": self.rejected, "last_error": self.last_error}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_submission_writer():
+    """
+    Return the process-wide SubmissionWriter, replaying submissions left in write-ahead
+    files by processes that are no longer running.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SubmissionWriter()
+    return _writer
+
+_run_writer = None
+
+def get_extraction_run_writer():
+    """
+    Return the process-wide writer of extraction_runs documents, with write-ahead
+    files of its own beside EXTRACTION_RUNS_WAL_PATH.
+    """
+    global _run_writer
+    if _run_writer is None:
+        with _writer_lock:
+            if _run_writer is None:
+                _run_writer = SubmissionWriter(
+                    get_extraction_runs_collection,
+                    EXTRACTION_RUNS_WAL_PATH,
+                    operation=extraction_run_insert,
+                    create_indexes=ensure_run_indexes,
+                )
+    return _run_writer
@@ -0,0 +1,33 @@
+import os
+import sys
+import fitz  # PyMuPDF for PDF
+import pytest
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def render_page(lines, dpi=200, fontsize=12):
+    """
+    Render an A4-ish PDF page with the given text lines and return it as PNG bytes,
+    the way a digital form page reaches the classifier and deduplicator.
+    """
+    with fitz.open() as doc:
+        page = doc.new_page()
+        y = 72
+        for line in lines:
+            page.insert_text((72, y), line, fontsize=fontsize)
+            y += fontsize * 1.6
+        return page.get_pixmap(dpi=dpi).tobytes("png")
+
+@pytest.fixture
+def form_page():
+    return render_page([
+        "MERCHANT APPLICATION FORM",
+        "Merchant Name Commercial: Al Noor Traders",
+        "Merchant Name legal: Al Noor Traders (Pvt) Ltd",
+        "Business Address Commercial: Plot 12, Block 6, PECHS",
+        "City: Karachi    Telephone / Cell: 021-1234567",
+        "NIC New: 42101-1234567-1    NIC (Old): 101-12-123456",
+        "Banker Name & Branch: UBL, Tariq Road",
+        "Account/IBAN: PK36SCBL0000001123456702",
+    ])
@@ -0,0 +1,24 @@
+import pytest
+from fastapi.testclient import TestClient
+
+api = pytest.importorskip("api")
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(api, "MULTIPART_OVERHEAD_BYTES", 512)
+    # The body must be refused before FastAPI parses it and calls the endpoint
+    monkeypatch.setattr(api, "read_upload", lambda file: pytest.fail("oversized upload was parsed"))
+    # Without the context manager the lifespan (and its job workers) does not start
+    return TestClient(api.api)
+
+def test_oversized_upload_is_refused_from_content_length(client):
+    response = client.post("/documents", files={"file": ("form.png", b"x" * 4096, "image/png")})
+    assert response.status_code == 413
+
+def test_oversized_chunked_upload_is_refused_while_streaming(client):
+    def body():
+        for _ in range(8):
+            yield b"x" * 1024
+    response = client.post("/documents", content=body(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
@@ -0,0 +1,13 @@
+import fitz  # PyMuPDF for PDF
+from documents import extract_images_from_pdf
+
+def test_pdf_images_keep_their_pdf_page_numbers():
+    with fitz.open() as doc:
+        for number in range(3):
+            doc.new_page().insert_text((72, 72), f"Page {number + 1}")
+        pdf_bytes = doc.tobytes()
+    # A skipped cover letter on page 1 must not shift the pages after it
+    images = extract_images_from_pdf(pdf_bytes, pages=[1, 2])
+    assert len(images) == 2
+    assert images.page_numbers == [2, 3]
+    assert len(list(images)) == 2
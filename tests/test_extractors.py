@@ -0,0 +1,27 @@
+import json
+import extractors
+from extractors import StubExtractor
+from pipeline import ERROR_RESULT
+
+class ChunkedStub(StubExtractor):
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+
+    def complete_stream(self, messages, deadline):
+        yield from self.chunks
+
+def test_truncated_stream_is_an_error(monkeypatch):
+    monkeypatch.setattr(extractors, "STREAM_EXTRACTION", True)
+    extractor = ChunkedStub(['{"A": 1, ', '"B": tru'])
+    assert extractor.stream(b"image", "prompt") == ERROR_RESULT
+
+def test_stream_stopped_once_required_keys_are_read_is_kept(monkeypatch):
+    monkeypatch.setattr(extractors, "STREAM_EXTRACTION", True)
+    extractor = ChunkedStub(['{"A": 1, ', '"B": tru'])
+    assert json.loads(extractor.stream(b"image", "prompt", required_keys=["A"])) == {"A": 1}
+
+def test_complete_stream_is_kept(monkeypatch):
+    monkeypatch.setattr(extractors, "STREAM_EXTRACTION", True)
+    extractor = ChunkedStub(['{"A": 1, ', '"B": true}'])
+    assert json.loads(extractor.stream(b"image", "prompt")) == {"A": 1, "B": True}
@@ -0,0 +1,40 @@
+import io
+from PIL import Image
+from image_dedup import Deduplicator, dedupe_images
+from conftest import render_page
+
+def _jpeg(png, scale=1.0, quality=70):
+    img = Image.open(io.BytesIO(png)).convert("RGB")
+    if scale != 1.0:
+        img = img.resize((int(img.width * scale), int(img.height * scale)))
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+def _document_pages():
+    pages = [
+        render_page([f"Page {page} Merchant Name {page * 7}: Shop {line} City: Karachi NIC {line * page}" for line in range(25 + page)])
+        for page in range(5)
+    ]
+    pages.append(render_page(["MERCHANT APPLICATION FORM", "Merchant Name Commercial: ____", "City: ____  Telephone: ____"] * 8))
+    pages.append(render_page(["TERMS AND CONDITIONS", "Merchant Name Commercial: ____", "City: ____  Telephone: ____"] * 8))
+    return pages
+
+def test_distinct_pages_of_one_document_are_kept():
+    deduplicator = Deduplicator()
+    assert [deduplicator.is_duplicate(page) for page in _document_pages()] == [False] * 7
+
+def test_rescaled_and_recompressed_copies_are_duplicates(form_page):
+    deduplicator = Deduplicator()
+    assert not deduplicator.is_duplicate(form_page)
+    assert deduplicator.is_duplicate(_jpeg(form_page, quality=60))
+    assert deduplicator.is_duplicate(_jpeg(form_page, scale=0.5))
+    assert deduplicator.is_duplicate(form_page)
+    assert deduplicator.duplicates == 3
+
+def test_image_list_keeps_the_highest_resolution_copy(form_page):
+    other_page = render_page(["TERMS AND CONDITIONS"] * 20)
+    thumbnail = _jpeg(form_page, scale=0.3)
+    full_scan = _jpeg(form_page)
+    assert dedupe_images([thumbnail, other_page, full_scan]) == [1, 2]
+    assert dedupe_images([full_scan, thumbnail, other_page, full_scan]) == [0, 2]
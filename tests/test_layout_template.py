@@ -0,0 +1,18 @@
+import layout_template
+from layout_template import LayoutTemplate, TemplatePage, refine_with_regions
+from form_schema import get_form_schema
+
+def test_refined_value_replaces_the_matched_extracted_key(monkeypatch):
+    schema = get_form_schema("merchant_application")
+    template = LayoutTemplate(schema.form_type, (TemplatePage(1.0, {"Telephone / Cell": (0.1, 0.1, 0.5, 0.2)}),))
+    monkeypatch.setattr(layout_template, "get_layout_template", lambda form_type: template)
+    monkeypatch.setattr(layout_template, "align_page", lambda image_bytes, template_page: (None, None))
+    monkeypatch.setattr(layout_template, "_crop_region", lambda img, to_pixels, box: b"crop")
+    monkeypatch.setattr(layout_template, "_query_crops", lambda extractor, title, crops, deadline: {"Telephone / Cell": "021-1234567"})
+    combined_json = {"Telephone": "12", "City": "Karachi"}
+    updated, refined = refine_with_regions(None, schema, [(b"page", "image/png", {})], combined_json)
+    assert refined == ["Telephone / Cell"]
+    assert "Telephone" not in updated
+    autofill = schema.matcher.match(updated)
+    assert autofill["Telephone / Cell"] == "021-1234567"
+    assert autofill["City"] == "Karachi"
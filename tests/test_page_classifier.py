@@ -0,0 +1,16 @@
+import page_classifier
+from page_classifier import classify_page_image, SKIP, UNKNOWN
+from conftest import render_page
+
+def test_rendered_form_page_is_kept(form_page):
+    assert classify_page_image(form_page) == UNKNOWN
+
+def test_single_line_of_text_is_not_blank():
+    assert classify_page_image(render_page(["Name: Ali    City: Karachi"])) == UNKNOWN
+
+def test_blank_page_is_skipped():
+    assert classify_page_image(render_page([])) == SKIP
+
+def test_form_page_is_kept_by_classify_page(form_page, monkeypatch):
+    monkeypatch.setattr(page_classifier, "PAGE_CLASSIFIER", "heuristic")
+    assert page_classifier.classify_page((form_page, "image/png", {}), "Merchant Application Form") != SKIP
@@ -0,0 +1,32 @@
+import time
+import threading
+from extractors import StubExtractor, record_model_calls
+import pipeline
+from pipeline import extract_in_groups, run_concurrently, run_streaming
+
+def test_worker_threads_record_their_model_calls():
+    extractor = StubExtractor(response="{}", delay=0.01)
+    with record_model_calls() as calls:
+        run_concurrently(range(3), lambda item: extractor.complete([], None), max_workers=3)
+    assert len(calls) == 3
+    with record_model_calls() as calls:
+        run_streaming(iter(range(5)), lambda item: extractor.complete([], None), max_workers=2)
+    assert len(calls) == 5
+
+def test_group_fallback_stays_within_the_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(pipeline, "PAGE_BATCH_SIZE", 4)
+    in_flight = [0]
+    peak = [0]
+    lock = threading.Lock()
+    def extract_single(page):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return "{}"
+    pages = [(b"x", "image/png", {}) for _ in range(12)]
+    results = extract_in_groups(pages, extract_single, lambda group: "not json", lambda result: False, max_workers=2)
+    assert len(results) == 12
+    assert peak[0] <= 2
@@ -0,0 +1,27 @@
+import time
+import pytest
+import scheduler
+from scheduler import RequestScheduler, DeadlineExceeded, document_deadline
+
+def test_waiting_for_a_rate_limit_token_does_not_fail_the_page():
+    calls = RequestScheduler("test", rate_per_minute=600, burst=1, max_retries=0)
+    calls.call(lambda: "first")
+    # The next token is 0.1 s away, longer than the whole document budget
+    deadline = time.monotonic() + 0.05
+    assert calls.call(lambda: "second", deadline) == "second"
+
+def test_retries_still_respect_the_deadline(monkeypatch):
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE_SECONDS", 10)
+    monkeypatch.setattr(scheduler.random, "uniform", lambda low, high: high)
+    calls = RequestScheduler("test", rate_per_minute=6000, burst=5, max_retries=3)
+    def timeout():
+        raise TimeoutError("provider timed out")
+    with pytest.raises(DeadlineExceeded):
+        calls.call(timeout, time.monotonic() + 5)
+
+def test_deadline_grows_with_page_count(monkeypatch):
+    monkeypatch.setattr(scheduler, "DOCUMENT_DEADLINE_SECONDS", 180)
+    monkeypatch.setattr(scheduler, "PAGE_DEADLINE_SECONDS", 20)
+    now = time.monotonic()
+    assert document_deadline(0) - now == pytest.approx(180, abs=1)
+    assert document_deadline(30) - now == pytest.approx(780, abs=1)
@@ -0,0 +1,78 @@
+import os
+import json
+from types import SimpleNamespace
+import mongomock
+import pytest
+import submissions
+from submissions import SubmissionWriter, build_extraction_run, extraction_run_insert, ensure_run_indexes
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.submitted_forms
+
+def _writer(collection, wal_path, pid, monkeypatch):
+    monkeypatch.setattr(os, "getpid", lambda: pid)
+    return SubmissionWriter(lambda: collection, str(wal_path), flush_seconds=3600)
+
+def _document(number):
+    return {
+        "_id": f"hash-{number}",
+        "schema_version": 2,
+        "fields": {"mid": str(number)},
+        "lookup": {"mid": str(number)},
+        "submitted_at": f"2026-01-0{number}T10:00:00+00:00",
+    }
+
+def test_each_process_keeps_its_own_write_ahead_file(tmp_path, collection, monkeypatch):
+    wal_path = tmp_path / ".submissions.wal"
+    first = _writer(collection, wal_path, 101, monkeypatch)
+    second = _writer(collection, wal_path, 102, monkeypatch)
+    first.submit(_document(1))
+    second.submit(_document(2))
+    assert first.wal_path != second.wal_path
+    # A flush in one process must not drop the other process's pending submission
+    assert first.flush()
+    assert os.path.exists(second.wal_path)
+    second.close()
+    first.close()
+    assert sorted(doc["_id"] for doc in collection.find()) == ["hash-1", "hash-2"]
+
+def test_stale_files_of_dead_processes_are_replayed(tmp_path, collection, monkeypatch):
+    wal_path = tmp_path / ".submissions.wal"
+    dead_path = tmp_path / ".submissions.wal.otherhost-7"
+    live_path = tmp_path / ".submissions.wal.otherhost-8"
+    dead_path.write_text(json.dumps(_document(1)) + "\n", encoding="utf-8")
+    live_path.write_text(json.dumps(_document(2)) + "\n", encoding="utf-8")
+    stale = os.path.getmtime(dead_path) - submissions.WAL_STALE_SECONDS - 1
+    os.utime(dead_path, (stale, stale))
+    writer = _writer(collection, wal_path, 103, monkeypatch)
+    writer.close()
+    assert [doc["_id"] for doc in collection.find()] == ["hash-1"]
+    assert not dead_path.exists()
+    assert live_path.exists()
+
+def test_extraction_run_writers_do_not_share_a_write_ahead_file(tmp_path, collection, monkeypatch):
+    schema = SimpleNamespace(form_type="merchant_application", prompt_version="abc123")
+    wal_path = str(tmp_path / ".extraction_runs.wal")
+    writers = []
+    for pid, job_id in ((201, "job-1"), (202, "job-2")):
+        monkeypatch.setattr(os, "getpid", lambda pid=pid: pid)
+        writer = SubmissionWriter(
+            lambda: collection, wal_path, flush_seconds=3600,
+            operation=extraction_run_insert, create_indexes=ensure_run_indexes,
+        )
+        writer.submit(build_extraction_run(job_id, schema, "file-hash", []))
+        writers.append(writer)
+    assert writers[0].flush()
+    assert os.path.exists(writers[1].wal_path)
+    for writer in writers:
+        writer.close()
+    assert sorted(doc["_id"] for doc in collection.find()) == ["job-1", "job-2"]
+
+def test_indexes_are_created_at_startup(monkeypatch):
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(submissions, "get_submissions_collection", lambda: database.submitted_forms)
+    monkeypatch.setattr(submissions, "get_extraction_runs_collection", lambda: database.extraction_runs)
+    assert submissions.create_indexes_at_startup() is None
+    assert "lookup_nic_new_submitted_at" in database.submitted_forms.index_information()
+    assert "file_hash" in database.extraction_runs.index_information()
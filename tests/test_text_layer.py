@@ -0,0 +1,41 @@
+import fitz  # PyMuPDF for PDF
+from text_layer import extract_pdf_text_layer, pages_needing_vision
+
+REQUIRED_KEYS = ["City", "Telephone / Cell", "MID", "Business Address Commercial", "Email"]
+
+def _pdf(*pages):
+    with fitz.open() as doc:
+        for lines in pages:
+            page = doc.new_page()
+            for index, line in enumerate(lines):
+                page.insert_text((72, 72 + index * 20), line, fontsize=11)
+        return doc.tobytes()
+
+def test_values_stop_at_the_next_label_on_the_row():
+    pdf = _pdf([
+        "City: Karachi    Telephone / Cell: 021-1234567",
+        "Business Address Commercial: Mid Town Plaza, Shahrah-e-Faisal",
+        "Email: info@example.com",
+    ])
+    fields, _, _ = extract_pdf_text_layer(pdf, REQUIRED_KEYS)
+    assert fields["City"] == "Karachi"
+    assert fields["Telephone / Cell"] == "021-1234567"
+    assert fields["Business Address Commercial"] == "Mid Town Plaza, Shahrah-e-Faisal"
+
+def test_partly_parsed_digital_page_goes_to_vision_with_scanned_pages():
+    pdf = _pdf(
+        [
+            "City: Karachi    Telephone / Cell: 021-1234567",
+            "Business Address Commercial: Plot 12, Block 6, PECHS",
+            "MID:",
+        ],
+        [
+            "Email: info@example.com",
+            "All required information has been provided on the form above.",
+        ],
+        [],
+    )
+    fields, text_pages, page_count = extract_pdf_text_layer(pdf, REQUIRED_KEYS)
+    assert "MID" not in fields
+    # Page 0 prints the MID label without a value, page 2 is scanned; page 1 is complete
+    assert pages_needing_vision(fields, text_pages, page_count, REQUIRED_KEYS) == [0, 2]
@@ -0,0 +1,146 @@
+import os
+import re
+import fitz  # PyMuPDF for PDF
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# A page with at least this many text-layer characters is treated as digital, not scanned
+MIN_TEXT_LAYER_CHARS = int(os.getenv("MIN_TEXT_LAYER_CHARS", "50"))
+# Vertical tolerance (in points) for spans to be considered on the same visual row
+ROW_TOLERANCE = 4
+
+_CHECKBOX_OFF_VALUES = ("", "Off", "off", "No", "False")
+
+# Lower-case and drop everything but letters and digits, e.g. "NIC (Old)" -> "nicold"
+def normalize_label(text):
+    return re.sub(r"[^a-z0-9]", "", (text or "").lower())
+
+# Index in line just past its first n_chars letters/digits
+def _label_end(line, n_chars):
+    seen = 0
+    for index, char in enumerate(line):
+        if seen == n_chars:
+            return index
+        if char.isalnum():
+            seen += 1
+    return len(line) if seen == n_chars else None
+
+# Return the text of line after its first n_chars letters/digits, without separators
+def _text_after_label(line, n_chars):
+    end = _label_end(line, n_chars)
+    if end is None:
+        return ""
+    return line[end:].lstrip(" :-_.\t|)]").rstrip()
+
+# Split a row like "City: Karachi  Telephone / Cell: 021-1234567" before every known label
+# after the first. A label only counts mid-row when it starts a word and is followed by a
+# separator or the end of the row, so values like "Mid Town" are not cut at "Mid".
+def _split_row(row, labels):
+    starts = [0]
+    for index in range(1, len(row)):
+        if not row[index].isalnum() or row[index - 1].isalnum():
+            continue
+        norm_rest = normalize_label(row[index:])
+        for norm_key, _ in labels:
+            if not norm_rest.startswith(norm_key):
+                continue
+            end = _label_end(row[index:], len(norm_key))
+            after = row[index + end:].lstrip(" ")
+            if not after or not after[0].isalnum():
+                starts.append(index)
+                break
+    return [row[start:end].strip() for start, end in zip(starts, starts[1:] + [len(row)])]
+
+# Group the spans of a page.get_text("dict") result into visual rows, top to bottom
+def _page_rows(page):
+    spans = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                if span["text"].strip():
+                    x0, y0, x1, y1 = span["bbox"]
+                    spans.append((round((y0 + y1) / 2 / ROW_TOLERANCE), x0, span["text"]))
+    rows = {}
+    for row_key, x0, text in sorted(spans):
+        rows.setdefault(row_key, []).append(text)
+    return [" ".join(parts).strip() for _, parts in sorted(rows.items())]
+
+# Map AcroForm widgets to required keys by field name or tooltip
+def _widget_fields(page, key_lookup):
+    fields = {}
+    for widget in page.widgets() or []:
+        value = widget.field_value
+        if value is None or str(value).strip() in _CHECKBOX_OFF_VALUES:
+            continue
+        for label in (widget.field_name, widget.field_label):
+            req_key = key_lookup.get(normalize_label(label))
+            if req_key and req_key not in fields:
+                fields[req_key] = str(value).strip()
+                break
+    return fields
+
+# Find "Label: value" pairs (or a lone label row followed by its value row) for the required
+# keys. Labels found without a value are returned with "" so the page can go to vision.
+def _text_fields(rows, labels):
+    fields = {}
+    for index, row in enumerate(rows):
+        segments = _split_row(row, labels)
+        for segment in segments:
+            norm_segment = normalize_label(segment)
+            for norm_key, req_key in labels:
+                if fields.get(req_key) or not norm_segment.startswith(norm_key):
+                    continue
+                value = _text_after_label(segment, len(norm_key))
+                if not value and len(segments) == 1 and index + 1 < len(rows):
+                    next_row = normalize_label(rows[index + 1])
+                    if not any(next_row.startswith(other) for other, _ in labels):
+                        value = rows[index + 1].strip()
+                fields[req_key] = value
+                break
+    return fields
+
+def extract_pdf_text_layer(pdf_bytes, required_keys):
+    """
+    Read AcroForm widgets and the text layer of a PDF and map them onto required_keys.
+    Returns (fields, text_pages, page_count) where fields only contains keys that were
+    found, and text_pages maps each page number that has a real text layer to the
+    required keys whose label is printed on it but whose value could not be read.
+    """
+    key_lookup = {normalize_label(k): k for k in required_keys}
+    # Longest labels first so "Business Address Legal" wins over a shorter prefix
+    labels = sorted(key_lookup.items(), key=lambda item: len(item[0]), reverse=True)
+    fields = {}
+    text_pages = {}
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+        for page in doc:
+            for req_key, value in _widget_fields(page, key_lookup).items():
+                fields.setdefault(req_key, value)
+            rows = _page_rows(page)
+            if sum(len(row) for row in rows) < MIN_TEXT_LAYER_CHARS:
+                continue
+            text_pages[page.number] = set()
+            for req_key, value in _text_fields(rows, labels).items():
+                if value:
+                    fields.setdefault(req_key, value)
+                else:
+                    text_pages[page.number].add(req_key)
+    return fields, text_pages, page_count
+
+def pages_needing_vision(fields, text_pages, page_count, required_keys):
+    """
+    Decide which PDF pages still have to go to the vision model after the text-layer pass.
+    No pages if every required key was found; every page if the text layer produced nothing.
+    Otherwise the scanned pages plus the digital pages that print the label of a key still
+    missing, or every page if that leaves none to send.
+    """
+    missing = {k for k in required_keys if fields.get(k) in (None, "")}
+    if not missing:
+        return []
+    all_pages = list(range(page_count))
+    if not fields:
+        return all_pages
+    pages = [p for p in all_pages if p not in text_pages or text_pages[p] & missing]
+    return pages or all_pages